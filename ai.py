@@ -1,52 +1,206 @@
 import time
 import random
+import threading
+from bisect import insort
+from collections import namedtuple
 from board import *
+from bitboard import BitBoard
+from vcf import VCF, VCF_NODES, VCF_LEAF_DEPTH, VCF_LEAF_NODES
+from vct import VCT, VCT_DEFEND_DEPTH
+from smp import LazySMP
+from timeman import TimeManager
+from book import OpeningBook, BOOK_PLIES
+
+HISTORY_SCALE = 64  # History score that orders a quiet move half a point higher
+ASPIRATION_WINDOW = 25   # Half width of the first window around the last iteration's score
+ASPIRATION_GROWTH = 4    # Widening of the window after each failed search
+ASPIRATION_LIMIT = 5000  # Scores this far from zero are searched with a full window
+LMR_MIN_DEPTH = 4        # Shallower nodes search every move to full depth
+LMR_FULL_MOVES = 3       # Moves searched to full depth before later quiet ones are reduced
+LMR_REDUCTION = 2        # Plies taken off a reduced move, even so the evaluation keeps its side
+DEPTH_VCT_NODES = 2000   # VCT node budget of each solver use in a search limited by depth alone
+
+# Limits of one search, None for none. Without any, the Gomocup clock (timeout_turn,
+# timeout_match, time_left) decides; otherwise only these apply, time in milliseconds.
+# A search limited by nodes and depth alone never reads the clock, so it is reproducible.
+SearchLimits = namedtuple("SearchLimits", "nodes depth time", defaults=(None, None, None))
+# Outcome of a search. move and pv are unpadded (x, y) tuples, move is None if there
+# was nothing to play; depth is that of the last finished iteration; time is in milliseconds. lines holds (move, score, pv) of the
+# best AI.multi_pv root moves, best first; after the chosen move only moves with
+# an exact score in the last finished iteration, so there may be fewer.
+SearchResult = namedtuple("SearchResult", "move score depth nodes nps time pv hash_hits hash_probes lines")
 
 class AI(Board):
     def __init__(self):
         super().__init__()
         self.total = 0
         self.hash_count = 0
+        self.hash_probes = 0
+        self.hash_hits = 0
+        self.hash_hit = 0     # Best move of the last probed entry
+        self.table_key = 0    # Key and symmetry of the position last looked up, see find_hash()
+        self.table_sym = 0
+        self.generation = 1   # Search number kept in table entries, 1-63
         self.search_depth = 0
         self.time_left = 10000000
         self.timeout_turn = 5000
         self.timeout_match = 10000000
         self.think_time = 0
+        self.stats = None     # SearchStats collector while one is attached, see stats.py
+        self.profiler = None  # Profiler while one is attached, see profiler.py
+        self.limits = SearchLimits()
+        # Functions called with a SearchResult after every completed iteration
+        self.info_callbacks = []
         self.best_point = Point()
         self.best_line = Line()
         self.start = 0
         self.stop_think = False
+        # Move time planning, and the node count at which the search next reads the clock
+        self.timeman = TimeManager()
+        self.next_poll = 0
         # Evaluation values for different patterns - increased weights for stronger play
         self.eval = [0, 3, 15, 30, 100, 200, 1000, 2000]
+        # Check the incremental pattern counts against a full board scan at every leaf
+        self.debug_eval = False
+        # Continuous-four solver, run before iterative deepening and optionally at leaves
+        self.vcf = VCF(self)
+        self.vcf_attack = True
+        self.vcf_leaf = False
+        self.vcf_time = 0.2  # Share of the move time, and of a node limit, given to the root search
+        # Threat-sequence solver, for our own wins and to avoid root moves that lose to one
+        self.vct = VCT(self, self.vcf)
+        self.vct_attack = True
+        self.vct_defend = True
+        self.vct_time = 0.1  # Share of the move time given to each of the two VCT uses
+        # Opening book built from the self-play corpora by book.py, None if there is none
+        self.book = OpeningBook.load()
+        self.use_book = True
+        # Move ordering learned from beta cutoffs: two killer moves per ply and a
+        # history score per side and square, both as pack_pos() values
+        self.use_killers = True
+        self.use_history = True
+        self.killers = [[0, 0] for _ in range(MAX_DEPTH + 1)]
+        self.history = [[0] * (1 << 10) for _ in range(2)]
+        self.cut_count = 0
+        self.first_cut_count = 0
+        # Lazy SMP: thread_num - 1 helper processes share the hash tables (see smp.py)
+        self.thread_num = 1
+        self.smp = None
+        self.helper_id = 0      # Non-zero in a helper process
+        self.stop_flag = None   # Shared stop signal of a helper
+        self.first_depth = MIN_DEPTH
+        self.completed_depth = 0
+        # Iterative deepening: depth increment, aspiration windows, and per search the
+        # number of root searches repeated after failing outside the window and the
+        # node count at which each depth was completed
+        self.depth_step = 2
+        self.use_aspiration = True
+        # First iteration depth, and moves searched per node when no threat rule prunes
+        # the list (at most 64, the size of a MoveList)
+        self.min_depth = MIN_DEPTH
+        self.max_moves = MAX_MOVES
+        # MultiPV: number of root moves searched for an exact score and PV, with the score
+        # and PV (a tuple of Pos) of each by pack_pos() of its first move, for the last
+        # finished iteration and the one being searched
+        self.multi_pv = 1
+        self.root_lines = {}
+        self.iter_lines = {}
+        # Late quiet moves are searched a ply shallower, fours a ply deeper
+        self.use_lmr = True
+        self.use_extensions = True
+        self.re_searches = 0
+        self.depth_nodes = {}
+        # Pondering: searching the expected reply on a background thread, off the clock
+        self.pondering = False
+        self.ponder_thread = None
+        self.ponder_move = None
+        self.ponder_best = None
+        self.abort_search = False
+        # The solvers give up as soon as the search is aborted
+        self.vcf.stop = self.vct.stop = self.search_aborted
 
     def get_time(self):
         """Return elapsed search time in milliseconds"""
-        return (time.time() - self.start) * 1000
+        return (self.timeman.clock() - self.start) * 1000
 
     def stop_time(self):
-        """Return available search time for this move"""
-        return min(self.timeout_turn, self.time_left // 5)  # Allow more time per move (changed from 7)
+        """Return the hard time limit for this move, none while pondering"""
+        return float("inf") if self.pondering else self.timeman.maximum
+
+    def time_up(self):
+        """Return True when the search has to stop, and schedule the next check"""
+        self.next_poll = self.total + self.timeman.poll_interval(self.total)
+        max_nodes = self.limits.nodes
+        if max_nodes is not None:
+            if self.total >= max_nodes:
+                return True
+            self.next_poll = min(self.next_poll, max_nodes)
+        if self.search_aborted():
+            return True
+        return self.get_time() >= self.stop_time()
+
+    def search_aborted(self):
+        """Return True when the search was stopped from outside: a ponder miss or, in a helper, the main engine"""
+        return self.abort_search or (self.stop_flag is not None and self.stop_flag.value)
+
+    def find_hash(self):
+        """Return the transposition table slot holding this position, or -1"""
+        # With symmetry on, the 8 images of a position share the entry of the canonical
+        # one, whose move is stored in the canonical frame
+        if self.use_symmetry:
+            key = min(self.sym_keys)
+            self.table_sym = self.sym_keys.index(key)
+        else:
+            key = self.zobrist_key
+            self.table_sym = 0
+        self.table_key = key
+        i = (key & (HASH_SIZE // HASH_WAYS - 1)) * HASH_WAYS
+        for j in range(i, i + HASH_WAYS):
+            # Lazy SMP helpers write entries without locks, so the key is stored XORed with
+            # the data word and a key and data from two different writes never match
+            if self.hash_key[j] ^ self.hash_data[j] == key:
+                return j
+        return -1
 
     def probe_hash(self, depth, alpha, beta):
-        """Query the transposition table"""
-        p_hashe = self.hash_table[self.zobrist_key & (HASH_SIZE - 1)]
-        if p_hashe.key == self.zobrist_key:
-            if p_hashe.depth >= depth:
-                if p_hashe.hashf == HASH_EXACT:
-                    return p_hashe.val
-                elif p_hashe.hashf == HASH_ALPHA and p_hashe.val <= alpha:
-                    return p_hashe.val
-                elif p_hashe.hashf == HASH_BETA and p_hashe.val >= beta:
-                    return p_hashe.val
+        """Query the transposition table, leaving the stored best move in hash_hit"""
+        self.hash_probes += 1
+        j = self.find_hash()
+        if j < 0:
+            self.hash_hit = 0
+            return UNKNOWN
+        self.hash_hits += 1
+        data = self.hash_data[j]
+        self.hash_hit = data >> 32 & 0xFFFF
+        if self.table_sym and self.hash_hit:
+            self.hash_hit = self.sym_pos[SYM_INVERSE[self.table_sym]][self.hash_hit]
+        if data >> 48 & 0xFF >= depth:
+            hashf = data >> 56 & 3
+            val = (((data & 0xFFFFFFFF) ^ 0x80000000) - 0x80000000) / 10
+            if hashf == HASH_EXACT:
+                return val
+            elif hashf == HASH_ALPHA and val <= alpha:
+                return val
+            elif hashf == HASH_BETA and val >= beta:
+                return val
         return UNKNOWN
 
-    def record_hash(self, depth, val, hashf):
+    def record_hash(self, depth, val, hashf, best):
         """Write to transposition table"""
-        p_hashe = self.hash_table[self.zobrist_key & (HASH_SIZE - 1)]
-        p_hashe.key = self.zobrist_key
-        p_hashe.val = val
-        p_hashe.hashf = hashf
-        p_hashe.depth = depth
+        j = self.find_hash()
+        if j < 0:
+            # The first slot keeps the deepest entry of this search, entries of older
+            # searches are given up first. Everything else goes to the second slot.
+            j = (self.table_key & (HASH_SIZE // HASH_WAYS - 1)) * HASH_WAYS
+            old = self.hash_data[j]
+            if old >> 58 == self.generation and old >> 48 & 0xFF > depth:
+                j += 1
+        move = pack_pos(best.x, best.y) if best.x != -1 else 0
+        if self.table_sym and move:
+            move = self.sym_pos[self.table_sym][move]
+        data = (round(val * 10) & 0xFFFFFFFF) | move << 32 | depth << 48 | hashf << 56 | self.generation << 58
+        self.hash_key[j] = self.table_key ^ data
+        self.hash_data[j] = data
 
     def put_chess(self, next_pos):
         """Place a chess piece on the board (interface method)"""
@@ -55,41 +209,149 @@ class AI(Board):
         self.make_move(next_pos)
 
     def get_best_move(self):
-        """Find and return the best move"""
-        best = self.main_search()
-        best.x -= 4
-        best.y -= 4
-        
-        # Output thinking information
-        print(f"MESSAGE depth={self.search_depth} NPS={self.total // (self.think_time + 1)}k")
-        print(f"MESSAGE best: [{best.x},{best.y}] val={self.best_point.val}")
-        print("MESSAGE bestLine:", end="")
-        for i in range(self.best_line.n):
-            print(f" [{self.best_line.moves[i].x - 4},{self.best_line.moves[i].y - 4}]", end="")
-        print()
-        
-        return best
+        """Find the best move, print the thinking information and return the move unpadded.
+
+        Returns None when there is no move to play, i.e. the board is full.
+        """
+        result = self.search()
+        self.report(result)
+        if result.move is None:
+            return None
+        return Pos(*result.move)
+
+    def search(self, limits=None):
+        """Search the position within limits (a SearchLimits), return a SearchResult"""
+        self.limits = limits if limits is not None else SearchLimits()
+        return self.search_result(self.main_search())
+
+    def search_result(self, best):
+        """SearchResult of the search that chose best"""
+        move = (best.x - 4, best.y - 4) if best.x != -1 else None
+        pv = tuple((self.best_line.moves[i].x - 4, self.best_line.moves[i].y - 4) for i in range(self.best_line.n))
+        if not pv or pv[0] != move:
+            pv = (move,) if move is not None else ()
+        lines = [(move, self.best_point.val, pv)] if move is not None else []
+        # The next best root moves of the last finished iteration. Bounds from failing low
+        # and scores of an unfinished iteration would not rank them correctly.
+        if self.multi_pv > 1 and lines:
+            ranked = sorted(self.root_lines.items(), key=lambda item: -item[1][0])
+            for v, (val, line) in ranked:
+                q = self.pos_table[v]
+                if len(lines) >= self.multi_pv:
+                    break
+                if (q.x - 4, q.y - 4) == move or self.is_lose[q.x][q.y]:
+                    continue
+                lines.append(((q.x - 4, q.y - 4), val, tuple((p.x - 4, p.y - 4) for p in line)))
+        return SearchResult(move, self.best_point.val, self.completed_depth, self.total,
+                            int(self.total * 1000 / max(self.think_time, 1)), self.think_time, pv,
+                            self.hash_hits, self.hash_probes, tuple(lines))
+
+    def report(self, result):
+        """Print the thinking information of a search as Gomocup MESSAGE lines"""
+        print(f"MESSAGE depth={result.depth} NPS={result.nps / 1000:.1f}k")
+        if self.re_searches:
+            print(f"MESSAGE re-searches={self.re_searches}")
+        if self.cut_count:
+            print(f"MESSAGE cutoffs={self.cut_count} first={self.first_cut_count * 100 // self.cut_count}%")
+        if self.hash_probes:
+            print(f"MESSAGE hash hits={self.hash_hits * 100 // self.hash_probes}% "
+                  f"cutoffs={self.hash_count * 100 // self.hash_probes}%")
+        if result.move is not None:
+            print(f"MESSAGE best: [{result.move[0]},{result.move[1]}] val={result.score}")
+        print("MESSAGE bestLine:" + "".join(f" [{x},{y}]" for x, y in result.pv))
+        if self.profiler is not None:
+            for line in self.profiler.report_lines():
+                print("MESSAGE " + line)
+
+    def start_ponder(self):
+        """Play the expected reply from best_line and search on in a background thread"""
+        if self.best_line.n < 2:
+            return False
+        p = self.best_line.moves[1]
+        if self.cell[p.x][p.y].piece != EMPTY:
+            return False
+        self.make_move(p)
+        if self.check_win():
+            self.del_move()
+            return False
+        self.ponder_move = p
+        self.pondering = True
+        self.abort_search = False
+        self.ponder_thread = threading.Thread(target=self.ponder_search, daemon=True)
+        self.ponder_thread.start()
+        return True
+
+    def ponder_search(self):
+        self.ponder_best = self.main_search()
+
+    def ponder_hit(self):
+        """The expected reply was played: put the running search on the clock, return its SearchResult"""
+        pondered = self.get_time()
+        self.start = self.timeman.ponderhit(self.timeout_turn, self.timeout_match, self.time_left, self.step)
+        self.pondering = False
+        # A search still running from here measures its time from the new start
+        running = self.ponder_thread.is_alive()
+        # Already thought longer than this move would get, answer with what we have
+        if self.completed_depth >= self.min_depth and pondered >= self.timeman.optimum:
+            self.stop_think = True
+        self.ponder_thread.join()
+        self.ponder_thread = None
+        if running:
+            self.think_time += pondered  # For the NPS report, the clock only saw the rest
+        return self.search_result(self.ponder_best)
+
+    def stop_ponder(self):
+        """Another reply was played: abort the search and take the expected one back"""
+        self.abort_search = True
+        self.ponder_thread.join()
+        self.ponder_thread = None
+        self.pondering = False
+        self.abort_search = False
+        self.del_move()
 
     def main_search(self):
-        """Main search function to find the best move"""
-        self.start = time.time()
+        """Main search function to find the best move, within self.limits"""
+        limits = self.limits
+        if limits.time is not None:
+            self.start = self.timeman.start_fixed(limits.time)
+        elif limits.nodes is not None or limits.depth is not None:
+            self.start = self.timeman.start_fixed(float("inf"))
+        else:
+            self.start = self.timeman.start(self.timeout_turn, self.timeout_match, self.time_left, self.step)
         self.total = 0
+        self.next_poll = 0
         self.hash_count = 0
+        self.hash_probes = 0
+        self.hash_hits = 0
+        self.generation = self.generation % 63 + 1
+        self.cut_count = 0
+        self.first_cut_count = 0
+        self.completed_depth = 0
+        self.re_searches = 0
+        self.depth_nodes = {}
+        self.root_count = 0
+        self.root_lines = {}
+        self.clear_ordering()
         
-        best_move = Pos()
+        # Known openings are played from the book without searching
+        if self.use_book and self.book is not None and self.size == self.book.size and self.step < BOOK_PLIES:
+            if self.use_symmetry:
+                move = self.book.choose_key(*self.canonical_key())
+            else:
+                move = self.book.choose([(self.rem_move[i].x - 4, self.rem_move[i].y - 4) for i in range(self.step)])
+            if move is not None and self.cell[move[0] + 4][move[1] + 4].piece == EMPTY:
+                return self.instant_move(self.pos_table[pack_pos(move[0] + 4, move[1] + 4)])
         
         # First move at center
         if self.step == 0:
-            best_move.x = self.size // 2 + 4
-            best_move.y = self.size // 2 + 4
-            return best_move
+            return self.instant_move(self.pos_table[pack_pos(self.size // 2 + 4, self.size // 2 + 4)])
         
         # Second and third moves randomly around first move
         if self.step == 1 or self.step == 2:
             # Check for diagonal threat from corner
             if self.check_diagonal_threat():
                 # Return the blocking move
-                return self.block_diagonal_threat()
+                return self.instant_move(self.block_diagonal_threat())
                 
             rx, ry = 0, 0
             random.seed(time.time())
@@ -98,31 +360,209 @@ class AI(Board):
                 ry = self.rem_move[0].y + random.randint(-self.step, self.step)
                 if self.check_xy(rx, ry) and self.cell[rx][ry].piece == Pieces.EMPTY.value:
                     break
-            best_move.x = rx
-            best_move.y = ry
-            return best_move
+            return self.instant_move(self.pos_table[pack_pos(rx, ry)])
+        
+        # A forced win by continuous fours or threats needs no full search, a VCT win is
+        # trusted as the threat-space result it is. Their nodes count towards a node
+        # limit, and their time is a share of the planned move time.
+        self.ply = 0
+        if self.vcf_attack:
+            best_move = self.vcf.search(max_nodes=self.vcf_nodes(), max_time=self.timeman.optimum * self.vcf_time)
+            self.total += self.vcf.nodes
+            if best_move is not None:
+                return self.forced_win(best_move, self.vcf.line)
+        if self.vct_attack:
+            best_move = self.vct.search(self.timeman.optimum * self.vct_time, max_nodes=self.vct_nodes())
+            self.total += self.vct.nodes
+            if best_move is not None:
+                return self.forced_win(best_move, [best_move])
+        
+        # Iterative deepening search, with Lazy SMP helpers on the same position
+        if self.thread_num > 1:
+            if self.smp is None:
+                self.smp = LazySMP(self)
+            self.smp.start(self.thread_num - 1, self.stop_time())
+            self.deepen()
+            self.join_helpers()
+        else:
+            self.deepen()
+        
+        self.think_time = self.get_time()
+        best_move = self.best_point.p
         
-        # Iterative deepening search
+        return best_move
+
+    def deepen(self, first_depth=None):
+        """Iterative deepening from first_depth (min_depth) in steps of depth_step, result in best_point"""
+        if first_depth is None:
+            first_depth = self.min_depth
         self.stop_think = False
         self.best_point.val = 0
-        self.ply = 0
+        last_depth = MAX_DEPTH if self.limits.depth is None else max(1, min(self.limits.depth, MAX_DEPTH))
+        first_depth = min(first_depth, last_depth)
+        self.first_depth = first_depth
+        self.completed_depth = 0
         self.is_lose = [[False for _ in range(MAX_SIZE + 4)] for _ in range(MAX_SIZE + 4)]
         
-        for i in range(MIN_DEPTH, MAX_DEPTH + 1, 2):
+        # The last iteration is at last_depth even when depth_step does not lead there
+        for i in list(range(first_depth, last_depth, self.depth_step)) + [last_depth]:
             if self.stop_think:
                 break
             self.search_depth = i
-            self.best_point = self.root_search(self.search_depth, -10001, 10000, self.best_line)
-            if self.stop_think or (self.search_depth >= 10 and 
-                                 self.get_time() >= 1000 and 
-                                 self.get_time() * 12 > self.stop_time()):
+            best = self.aspiration_search(i)
+            # An interrupted iteration that proved nothing keeps the previous result
+            if best is not None:
+                self.best_point = best
+            # root_search() also stops on a win or a single legal move, those iterations are finished
+            if not self.stop_think or (best is not None and (best.val >= 10000 or self.root_count == 1)):
+                self.completed_depth = i
+                self.depth_nodes[i] = self.total
+                self.root_lines = self.iter_lines
+                if self.info_callbacks and not self.helper_id:
+                    self.think_time = self.get_time()
+                    result = self.search_result(self.best_point.p)
+                    for callback in self.info_callbacks:
+                        callback(result)
+            # Helpers search until the main engine stops them, pondering until a reply comes
+            done = self.timeman.iteration_done(self.best_point.p, self.best_point.val)
+            if self.stop_think or (done and not self.helper_id and not self.pondering):
                 break
+
+    def aspiration_search(self, depth):
+        """Root search in a window around the last score, widened until the score falls inside.
+
+        Returns the best root Point, or None if the search stopped before any move
+        beat the lower bound.
+        """
+        prev = self.best_point.val
+        if (not self.use_aspiration or self.multi_pv > 1 or depth == self.first_depth or
+                abs(prev) >= ASPIRATION_LIMIT):
+            alpha, beta = -10001, 10000
+        else:
+            alpha, beta = max(prev - ASPIRATION_WINDOW, -10001), min(prev + ASPIRATION_WINDOW, 10000)
+        delta = ASPIRATION_WINDOW
+        while True:
+            best = self.root_search(depth, alpha, beta, self.best_line)
+            if self.stop_think:
+                return best if best.val > alpha or depth == self.first_depth else None
+            if alpha < best.val < beta or (alpha <= -10001 and beta >= 10000):
+                return best
+            # Failed low or high: search again with that side of the window pushed out
+            self.re_searches += 1
+            delta *= ASPIRATION_GROWTH
+            if best.val <= alpha:
+                alpha = max(prev - delta, -10001)
+            else:
+                beta = min(prev + delta, 10000)
+
+    def join_helpers(self):
+        """Stop the Lazy SMP helpers and keep the deepest completed result within the depth limit"""
+        last_depth = MAX_DEPTH if self.limits.depth is None else self.limits.depth
+        for depth, move, val, line, nodes in self.smp.finish():
+            self.total += nodes
+            p = self.pos_table[move]
+            # A single legal move is played without searching, helpers only report a depth for it
+            if (move and self.completed_depth < depth <= last_depth and self.best_point.val < 10000 and
+                    self.root_count > 1 and not self.is_lose[p.x][p.y]):
+                self.completed_depth = self.search_depth = depth
+                self.best_point = Point(p, val)
+                self.best_line.n = len(line)
+                for i in range(len(line)):
+                    self.best_line.moves[i] = self.pos_table[line[i]]
         
+    def clear_ordering(self):
+        """Forget killers and age the history scores before a new search"""
+        for k in self.killers:
+            k[0] = k[1] = 0
+        for h in self.history:
+            for i in range(len(h)):
+                h[i] >>= 1
+
+    def record_cutoff(self, p, depth, index):
+        """Learn from a move that caused a beta cutoff, index counts from 0 in search order"""
+        self.cut_count += 1
+        if index == 0:
+            self.first_cut_count += 1
+        v = pack_pos(p.x, p.y)
+        k = self.killers[self.ply]
+        if k[0] != v:
+            k[1] = k[0]
+            k[0] = v
+        self.history[self.who][v] += depth * depth
+
+    def promote_killers(self, move_list):
+        """Move this ply's killers that are in the list to its front"""
+        for k in (self.killers[self.ply][1], self.killers[self.ply][0]):
+            if k == 0:
+                continue
+            killer = self.pos_table[k]
+            for i in range(1, move_list.n):
+                if move_list.moves[i] is killer:
+                    for j in range(i, 0, -1):
+                        move_list.moves[j] = move_list.moves[j - 1]
+                    move_list.moves[0] = killer
+                    break
+
+    def vcf_nodes(self):
+        """Node budget of the VCF search before iterative deepening"""
+        if self.limits.nodes is not None:
+            return max(1, min(VCF_NODES, int(self.limits.nodes * self.vcf_time)))
+        return VCF_NODES
+
+    def vct_nodes(self):
+        """Node budget of a VCT search under a node or depth limit, None without one"""
+        limits = self.limits
+        if limits.nodes is not None:
+            return max(1, int(limits.nodes * self.vct_time))
+        # No clock either, so the solvers would run unbounded
+        if limits.depth is not None and limits.time is None:
+            return DEPTH_VCT_NODES
+        return None
+
+    def instant_move(self, move):
+        """Report a move chosen without searching (book, opening rules) as the search result"""
+        self.search_depth = self.completed_depth = 0
+        self.best_point.p = move
+        self.best_point.val = 0
+        self.best_line.n = 1
+        self.best_line.moves[0] = move
         self.think_time = self.get_time()
-        best_move = self.best_point.p
-        
-        return best_move
+        return move
+
+    def forced_win(self, move, line):
+        """Report a solver win as the search result.
+
+        A VCF win is proven. A VCT win is only proven in threat space (see VCT), but it
+        is reported with the same score of 10000.
+        """
+        self.search_depth = self.completed_depth = len(line)
+        self.best_point.p = move
+        self.best_point.val = 10000
+        self.best_line.n = min(len(line), MAX_DEPTH)
+        for i in range(self.best_line.n):
+            self.best_line.moves[i] = line[i]
+        self.think_time = self.get_time()
+        return move
+
+    def mark_vct_losses(self, max_time):
+        """Mark root moves after which the opponent has a VCT in is_lose"""
+        losing = []
+        # The budget is shared by the root moves
+        max_nodes = self.vct_nodes()
+        if max_nodes is not None:
+            max_nodes = max(1, max_nodes // self.root_count)
+        for i in range(self.root_count):
+            p = self.root_move[i].p
+            self.make_move(p)
+            if self.vct.search(max_time / self.root_count, VCT_DEFEND_DEPTH, max_nodes) is not None:
+                losing.append(p)
+            self.del_move()
         
+        # If every move loses, leave the choice to the search
+        if len(losing) < self.root_count:
+            for p in losing:
+                self.is_lose[p.x][p.y] = True
+
     def check_diagonal_threat(self):
         """Check for diagonal threat from corner"""
         # Check if opponent has pieces forming a diagonal from corner
@@ -187,24 +627,37 @@ class AI(Board):
         return blocking_move
 
     def root_search(self, depth, alpha, beta, pline):
-        """Root node search with additional move ordering"""
-        best = self.root_move[0]
-        line = Line()
+        """Root node search with additional move ordering, returns a new Point"""
+        line = self.line_stack[0]
+        self.iter_lines = {}
         
-        if depth == MIN_DEPTH:
-            moves = [Pos() for _ in range(64)]
+        if depth == self.first_depth:
+            moves = self.root_moves
             self.root_count = self.generate_move(moves)
             
+            # No move scores anything on a nearly full board, play any empty candidate; a
+            # full board has none, the search then has no move
+            if self.root_count == 0:
+                self.stop_think = True
+                pline.n = 0
+                empty = sorted(self.cand_list)
+                return Point(self.pos_table[empty[0]] if empty else self.pos_table[0], 0)
+            
             # Only one valid move, return directly
             if self.root_count == 1:
                 self.stop_think = True
-                best.p = moves[0]
-                best.val = 0
                 pline.n = 0
-                return best
+                return Point(moves[0], 0)
             
             for i in range(self.root_count):
                 self.root_move[i].p = moves[i]
+            # Helpers past the first pair start from another root move to spread the work
+            if self.helper_id >= 2 and self.root_count > 1:
+                j = (self.helper_id // 2) % self.root_count
+                self.root_move[0].p, self.root_move[j].p = moves[j], moves[0]
+            
+            if self.vct_defend:
+                self.mark_vct_losses(self.timeman.optimum * self.vct_time)
         else:
             # Sort moves by value
             for i in range(1, self.root_count):
@@ -213,29 +666,46 @@ class AI(Board):
                     self.root_move[0] = self.root_move[i]
                     self.root_move[i] = temp
         
+        # root_move is rescored and reordered below, so the result is a Point of its own,
+        # kept at alpha until a move beats it
+        best = Point(self.root_move[0].p, alpha)
+        # With MultiPV, moves are searched against the k-th best score so far instead of
+        # the best, so the best k all get exact scores
+        k = self.multi_pv
+        root_alpha = alpha
+        scores = []  # Ascending
+        
         # Traverse possible moves
         for i in range(self.root_count):
             # Search non-losing points
             p = self.root_move[i].p
             if not self.is_lose[p.x][p.y]:
+                low = alpha
+                if k > 1:
+                    low = root_alpha if len(scores) < k else max(root_alpha, scores[-k])
                 line.n = 0
                 self.make_move(p)
                 
-                # PVS Search
-                if i > 0 and alpha + 1 < beta:
-                    val = -self.alpha_beta(depth - 1, -alpha - 1, -alpha, line)
-                    if val > alpha and val < beta:
-                        val = -self.alpha_beta(depth - 1, -beta, -alpha, line)
+                # PVS Search, the first k moves of MultiPV get a full window
+                if i > 0 and low + 1 < beta and (k == 1 or len(scores) >= k):
+                    val = -self.alpha_beta(depth - 1, -low - 1, -low, line)
+                    if val > low and val < beta:
+                        val = -self.alpha_beta(depth - 1, -beta, -low, line)
                 else:
-                    val = -self.alpha_beta(depth - 1, -beta, -alpha, line)
+                    val = -self.alpha_beta(depth - 1, -beta, -low, line)
                 
                 self.del_move()
                 
-                self.root_move[i].val = val
-                
                 if self.stop_think:
                     break
                 
+                self.root_move[i].val = val
+                if k > 1:
+                    insort(scores, val)
+                    # Inside the window the score is exact, a win is exact at beta as well
+                    if low < val < beta or val >= 10000:
+                        self.iter_lines[pack_pos(p.x, p.y)] = (val, (p,) + tuple(line.moves[:line.n]))
+                
                 if val == -10000:
                     self.is_lose[p.x][p.y] = True
                 
@@ -254,6 +724,11 @@ class AI(Board):
                     if val == 10000:
                         self.stop_think = True
                         return best
+                    
+                    # Fail high: the rest would be searched with alpha above beta,
+                    # aspiration_search() widens the window and searches again
+                    if val >= beta:
+                        return best
         
         return best
 
@@ -265,10 +740,8 @@ class AI(Board):
         """
         if move_list.phase == 0:
             move_list.phase = 1
-            e = self.pvs_table[self.zobrist_key % PVS_SIZE]
-            if e.key == self.zobrist_key:
-                move_list.hash_move = e.best
-                return e.best
+            if move_list.hash_move.x != -1:
+                return move_list.hash_move
         
         if move_list.phase == 1:
             move_list.phase = 2
@@ -282,26 +755,22 @@ class AI(Board):
                             move_list.moves[j - 1] = move_list.moves[j]
                         move_list.n -= 1
                         break
+            if self.use_killers:
+                self.promote_killers(move_list)
         
         if move_list.phase == 2 and move_list.index < move_list.n:
             move_list.index += 1
             return move_list.moves[move_list.index - 1]
         
-        return Pos(-1, -1)
-
-    def record_pvs(self, best):
-        """Record PVS move"""
-        e = self.pvs_table[self.zobrist_key % PVS_SIZE]
-        e.key = self.zobrist_key
-        e.best = best
+        return self.pos_table[0]
 
     def alpha_beta(self, depth, alpha, beta, pline):
         """Alpha-beta search with PVS"""
         self.total += 1
         
-        # Check time periodically
-        if self.total % 1000 == 0:
-            if self.get_time() + 50 >= self.stop_time():
+        # Check time periodically, how often depends on the measured speed
+        if self.total >= self.next_poll:
+            if self.time_up():
                 self.stop_think = True
                 return alpha
         
@@ -311,6 +780,8 @@ class AI(Board):
         
         # Leaf node
         if depth <= 0:
+            if self.vcf_leaf and self.vcf.search(VCF_LEAF_DEPTH, VCF_LEAF_NODES) is not None:
+                return 10000
             return self.evaluate()
         
         # Query hash table
@@ -319,40 +790,61 @@ class AI(Board):
             self.hash_count += 1
             return val
         
-        line = Line()
-        move_list = MoveList()
+        # Reuse this ply's buffers, children write their PV into line
+        line = self.line_stack[self.ply]
+        move_list = self.move_stack[self.ply]
         move_list.phase = 0
         move_list.first = True
+        move_list.hash_move = self.pos_table[self.hash_hit]  # Best move stored by probe_hash
         
         p = self.get_next_move(move_list)
-        best = Point(p, -10000)
+        best_p = p
+        best_val = -10000
         hashf = HASH_ALPHA
+        searched = 0
+        killers = self.killers[self.ply]
         
         while p.x != -1:
             line.n = 0
+            full = new_depth = depth - 1
+            who_p = self.cell[p.x][p.y].pattern[self.who]
+            opp_p = self.cell[p.x][p.y].pattern[self.opp]
+            # A four leaves the opponent a single reply, search it a ply deeper while the
+            # per-ply buffers allow. Extending the forced block as well would let chains of
+            # fours run to MAX_DEPTH for free.
+            if (self.use_extensions and self.ply + depth < MAX_DEPTH and
+                    (BLOCK4 in who_p or FLEX4 in who_p)):
+                full = new_depth = depth
+            # Late moves that make no three or four for either side and were never killers
+            elif (self.use_lmr and depth >= LMR_MIN_DEPTH and searched >= LMR_FULL_MOVES and
+                    max(who_p) < FLEX3 and max(opp_p) < FLEX3 and pack_pos(p.x, p.y) not in killers):
+                new_depth = depth - 1 - LMR_REDUCTION
+            searched += 1
             self.make_move(p)
             
-            # PVS Search
-            if not move_list.first and alpha + 1 < beta:
-                val = -self.alpha_beta(depth - 1, -alpha - 1, -alpha, line)
-                if val > alpha and val < beta:
-                    val = -self.alpha_beta(depth - 1, -beta, -alpha, line)
+            # PVS Search, a reduced move that beats alpha is searched again to full depth
+            if move_list.first:
+                val = -self.alpha_beta(full, -beta, -alpha, line)
             else:
-                val = -self.alpha_beta(depth - 1, -beta, -alpha, line)
+                val = -self.alpha_beta(new_depth, -alpha - 1, -alpha, line)
+                if val > alpha and new_depth < full:
+                    val = -self.alpha_beta(full, -alpha - 1, -alpha, line)
+                if val > alpha and val < beta and alpha + 1 < beta:
+                    val = -self.alpha_beta(full, -beta, -alpha, line)
             
             self.del_move()
             
             if self.stop_think:
-                return best.val
+                return best_val
             
             if val >= beta:
-                self.record_hash(depth, val, HASH_BETA)
-                self.record_pvs(p)
+                self.record_hash(depth, val, HASH_BETA, p)
+                self.record_cutoff(p, depth, searched - 1)
                 return val
             
-            if val > best.val:
-                best.val = val
-                best.p = p
+            if val > best_val:
+                best_val = val
+                best_p = p
                 if val > alpha:
                     hashf = HASH_EXACT
                     alpha = val
@@ -364,10 +856,9 @@ class AI(Board):
             p = self.get_next_move(move_list)
             move_list.first = False
         
-        self.record_hash(depth, best.val, hashf)
-        self.record_pvs(best.p)
+        self.record_hash(depth, best_val, hashf, best_p)
         
-        return best.val
+        return best_val
 
     def cut_move_list(self, move, cand, cand_count):
         """Prune the move list based on patterns"""
@@ -395,7 +886,7 @@ class AI(Board):
                     self.is_type(p, self.opp, BLOCK4)):
                     move[move_count] = cand[i].p
                     move_count += 1
-                    if move_count >= MAX_MOVES:
+                    if move_count >= self.max_moves:
                         break
         
         return move_count
@@ -405,15 +896,20 @@ class AI(Board):
         cand_count = 0
         move_count = 0
         
-        # Find all candidate moves
-        for i in range(self.b_start, self.b_end):
-            for j in range(self.b_start, self.b_end):
-                if (self.cell[i][j].is_cand > 0 and 
-                    self.cell[i][j].piece == Pieces.EMPTY.value):
-                    val = self.evaluate_move(self.cell[i][j], i, j)  # Pass coordinates
-                    if val > 0:
-                        self.cand[cand_count] = Point(Pos(i, j), val)
-                        cand_count += 1
+        # Score all candidate moves, in board order so equal scores keep a stable order
+        cand = self.cand
+        history = self.history[self.who]
+        for v in sorted(self.cand_list):
+            p = self.pos_table[v]
+            val = self.evaluate_move(self.cell[p.x][p.y], p.x, p.y)  # Pass coordinates
+            # History breaks ties between quiet moves, as a fraction below 1 so it never
+            # reorders different pattern scores or the threat values cut_move_list looks for
+            if val < 200 and self.use_history and history[v]:
+                val += history[v] / (history[v] + HISTORY_SCALE)
+            if val > 0:
+                cand[cand_count].p = p
+                cand[cand_count].val = val
+                cand_count += 1
         
         # Sort by value
         self.sort(self.cand, cand_count)
@@ -421,9 +917,9 @@ class AI(Board):
         # Try pruning, if pruning fails, return 0
         move_count = self.cut_move_list(move, self.cand, cand_count)
         
-        # If no pruning, copy the top MAX_MOVES moves
+        # If no pruning, copy the top max_moves moves
         if move_count == 0:
-            for i in range(min(cand_count, MAX_MOVES)):
+            for i in range(min(cand_count, self.max_moves)):
                 move[i] = self.cand[i].p
                 move_count += 1
         
@@ -439,8 +935,19 @@ class AI(Board):
                 j -= 1
             a[j] = key
 
-    def evaluate(self):
-        """Evaluate board position"""
+    def count_types(self):
+        """Pattern type counts of both sides, from the histograms kept by make_move"""
+        who_type = self.type_hist[self.who][:]
+        opp_type = self.type_hist[self.opp][:]
+        
+        # Two blocked fours on one cell = one active four
+        n = self.block4_cells[self.who]
+        who_type[BLOCK4] -= 2 * n
+        who_type[FLEX4] += n
+        return who_type, opp_type
+
+    def count_types_scan(self):
+        """Pattern type counts of both sides, by scanning the whole board"""
         who_type = [0] * 8
         opp_type = [0] * 8
         block4_temp = 0
@@ -459,6 +966,21 @@ class AI(Board):
                         who_type[BLOCK4] -= 2
                         who_type[FLEX4] += 1
         
+        return who_type, opp_type
+
+    def evaluate(self):
+        """Evaluate board position"""
+        if self.debug_eval:
+            counts = self.count_types()
+            scan = self.count_types_scan()
+            assert counts == scan, f"incremental {counts} != scan {scan}"
+        
+        # Read the histograms in place, count_types() without the copies
+        who_type = self.type_hist[self.who]
+        opp_type = self.type_hist[self.opp]
+        # Two blocked fours on one cell = one active four
+        n = self.block4_cells[self.who]
+        
         # If own side has a winning pattern, win
         if who_type[WIN] >= 1:
             return 10000
@@ -466,14 +988,14 @@ class AI(Board):
         if opp_type[WIN] >= 2:
             return -10000
         # If opponent cannot win and own side has an active four, win
-        if opp_type[WIN] == 0 and who_type[FLEX4] >= 1:
+        if opp_type[WIN] == 0 and who_type[FLEX4] + n >= 1:
             return 10000
         # If opponent has an active four, prioritize blocking it
         if opp_type[FLEX4] >= 1:
             return -9000
         
         # Calculate score
-        who_score = 0
+        who_score = n * (self.eval[FLEX4] - 2 * self.eval[BLOCK4])
         opp_score = 0
         for i in range(1, 8):
             who_score += who_type[i] * self.eval[i]
@@ -484,26 +1006,30 @@ class AI(Board):
 
     def evaluate_move(self, c, x=None, y=None):
         """Evaluate a specific move"""
-        score = [0, 0]
-        score[self.who] = self.pval[c.pattern[self.who][0]][c.pattern[self.who][1]][c.pattern[self.who][2]][c.pattern[self.who][3]]
-        score[self.opp] = self.pval[c.pattern[self.opp][0]][c.pattern[self.opp][1]][c.pattern[self.opp][2]][c.pattern[self.opp][3]]
+        who_p = c.pattern[self.who]
+        opp_p = c.pattern[self.opp]
+        who_score = self.pval[who_p[0]][who_p[1]][who_p[2]][who_p[3]]
+        opp_score = self.pval[opp_p[0]][opp_p[1]][opp_p[2]][opp_p[3]]
         
         # Check if this move is on a diagonal from corner and gives bonus points
         # Only check if coordinates are provided
         if x is not None and y is not None:
             for i in range(4):
-                if c.pattern[self.opp][i] >= FLEX2:  # If opponent can form at least two in a row
+                if opp_p[i] >= FLEX2:  # If opponent can form at least two in a row
                     # Find the coordinates
                     dir_x, dir_y = dx[i], dy[i]
                     if dir_x == 1 and dir_y == 1:  # Diagonal
                         # Check if near corner
                         if abs(x - 4) <= 5 and abs(y - 4) <= 5:  # Near top-left
-                            score[self.opp] += 50  # Bonus for blocking diagonal threat
+                            opp_score += 50  # Bonus for blocking diagonal threat
                         elif abs(x - (self.size + 4 - 1)) <= 5 and abs(y - 4) <= 5:  # Near top-right
-                            score[self.opp] += 50
+                            opp_score += 50
         
         # If score >= 200 (double active three or better), return the higher score
-        if score[self.who] >= 200 or score[self.opp] >= 200:
-            return score[self.who] * 2 if score[self.who] >= score[self.opp] else score[self.opp]
+        if who_score >= 200 or opp_score >= 200:
+            return who_score * 2 if who_score >= opp_score else opp_score
         else:
-            return score[self.who] * 2 + score[self.opp]
\ No newline at end of file
+            return who_score * 2 + opp_score
+
+class BitBoardAI(BitBoard, AI):
+    """AI searching on the bitboard backend instead of the Cell grid"""
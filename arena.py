@@ -0,0 +1,208 @@
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+from board import *
+from book import corpus_games
+
+# Opening set, rebuilt with "python arena.py openings"
+ARENA_OPENINGS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "arena_openings.json")
+ARENA_OPENINGS = 50        # Openings in the set, each played with both colours
+ARENA_OPENING_PLIES = 6    # Stones on the board in an opening
+ARENA_BALANCE = 300        # Largest search score of an opening counting as balanced
+ARENA_BALANCE_NODES = 3000  # Node limit of the search scoring an opening
+ARENA_NODES = 2000         # Default node limit per move
+SPRT_ELO0 = 0              # Null hypothesis: A is this many Elo stronger than B
+SPRT_ELO1 = 20             # Alternative hypothesis
+SPRT_ALPHA = 0.05          # False positive rate
+SPRT_BETA = 0.05           # False negative rate
+
+def build_openings(count=ARENA_OPENINGS, plies=ARENA_OPENING_PLIES, path=ARENA_OPENINGS_FILE):
+    """Write the first distinct corpus openings that a fixed-node search scores as balanced"""
+    from ai import BitBoardAI, SearchLimits
+    from bench import set_position
+    engine = BitBoardAI()
+    engine.set_size(15)
+    engine.use_book = False
+    openings = []
+    seen = set()
+    for moves in corpus_games():
+        key = tuple(moves[:plies])
+        if len(moves) < plies + 10 or key in seen:
+            continue
+        seen.add(key)
+        set_position(engine, key)
+        result = engine.search(SearchLimits(nodes=ARENA_BALANCE_NODES))
+        if abs(result.score) <= ARENA_BALANCE:
+            openings.append({"moves": [list(m) for m in key], "score": round(result.score, 1)})
+            if len(openings) >= count:
+                break
+    if not openings:
+        raise ValueError("No balanced openings in the corpus games")
+    with open(path, "w") as f:
+        f.write('{"openings": [\n' + ",\n".join(json.dumps(o) for o in openings) + "\n]}\n")
+    print(f"Wrote {len(openings)} openings to {path}")
+    return openings
+
+def load_openings(path=ARENA_OPENINGS_FILE):
+    with open(path) as f:
+        openings = [o["moves"] for o in json.load(f)["openings"]]
+    if not openings:
+        raise ValueError(f"No openings in {path}")
+    return openings
+
+_engines = {}  # Engine of each side of a worker process, with the config it was set up with
+
+def arena_engine(side, config):
+    # One engine per side and process, replaced if the side's config changes
+    from ai import BitBoardAI
+    cached = _engines.get(side)
+    if cached is not None and cached[1] == config:
+        return cached[0]
+    engine = BitBoardAI()
+    engine.set_size(15)
+    engine.use_book = False
+    for attr, value in config.items():
+        if not hasattr(engine, attr):
+            raise ValueError(f"AI has no attribute {attr}")
+        setattr(engine, attr, value)
+    _engines[side] = (engine, config)
+    return engine
+
+def play_game(args):
+    """Play one game from an opening, return (index, score of A, plies)"""
+    from ai import SearchLimits
+    from bench import set_position
+    index, opening, a_black, config_a, config_b, limits = args
+    a = arena_engine("a", config_a)
+    b = arena_engine("b", config_b)
+    for engine in (a, b):
+        set_position(engine, opening)
+    black, white = (a, b) if a_black else (b, a)
+    limits = SearchLimits(**limits)
+    score = 0.5  # A full board, or no move left to play, is a draw
+    while a.step < a.size * a.size:
+        mover = black if a.step % 2 == 0 else white
+        result = mover.search(limits)
+        if result.move is None:
+            break
+        x, y = result.move
+        for engine in (a, b):
+            engine.make_move(engine.pos_table[pack_pos(x + 4, y + 4)])
+        if a.check_win():
+            score = 1.0 if mover is a else 0.0
+            break
+    return index, score, a.step
+
+def elo(score):
+    """Elo difference of an expected score, infinite for 0 and 1"""
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return -400 * math.log10(1 / score - 1)
+
+def expected_score(elo_diff):
+    return 1 / (1 + 10 ** (-elo_diff / 400))
+
+def sprt_llr(scores, elo0=SPRT_ELO0, elo1=SPRT_ELO1):
+    """Log-likelihood ratio of elo1 against elo0 for game scores of A, 0 without variance.
+
+    Normal approximation of the generalized SPRT, with draws taken into account
+    through the measured variance of the game scores.
+    """
+    n = len(scores)
+    if n == 0:
+        return 0.0
+    mean = sum(scores) / n
+    var = sum(s * s for s in scores) / n - mean * mean
+    if var <= 0:
+        return 0.0
+    s0, s1 = expected_score(elo0), expected_score(elo1)
+    return n * (s1 - s0) * (2 * mean - s0 - s1) / (2 * var)
+
+def sprt_bounds(alpha=SPRT_ALPHA, beta=SPRT_BETA):
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+def summary(scores):
+    """Return (wins, draws, losses, elo, error) of A, error being the 95% margin"""
+    n = len(scores)
+    wins, draws = scores.count(1.0), scores.count(0.5)
+    mean = sum(scores) / n
+    var = sum(s * s for s in scores) / n - mean * mean
+    margin = 1.96 * math.sqrt(max(var, 0) / n)
+    low, high = mean - margin, mean + margin
+    error = (elo(high) - elo(low)) / 2 if 0 < low and high < 1 else math.inf
+    return wins, draws, n - wins - draws, elo(mean), error
+
+def run_arena(config_a, config_b, games=None, limits=None, processes=None,
+              elo0=SPRT_ELO0, elo1=SPRT_ELO1, alpha=SPRT_ALPHA, beta=SPRT_BETA):
+    """Play A against B over the opening set until the SPRT decides or the games run out.
+
+    Configs are dicts of AI attributes; every opening is played twice with the
+    colours swapped, games at a time across a process pool. Prints W/D/L, Elo of
+    A with its 95% error and the log-likelihood ratio after every game, and
+    returns "H1" (A is elo1 stronger), "H0" (A is no better than elo0) or None.
+    """
+    openings = load_openings()
+    if games is None:
+        games = 2 * len(openings)
+    if limits is None:
+        limits = {"nodes": ARENA_NODES}
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    tasks = [(i, openings[i // 2 % len(openings)], i % 2 == 0, config_a, config_b, limits) for i in range(games)]
+    lower, upper = sprt_bounds(alpha, beta)
+    print(f"A {json.dumps(config_a)} vs B {json.dumps(config_b)}, {games} games, {limits}, {processes} processes")
+    print(f"SPRT elo0={elo0} elo1={elo1} alpha={alpha} beta={beta}, bounds [{lower:.2f}, {upper:.2f}]")
+    scores = []
+    decision = None
+    t = time.time()
+    with multiprocessing.Pool(processes=processes) as pool:
+        for index, score, plies in pool.imap_unordered(play_game, tasks):
+            scores.append(score)
+            wins, draws, losses, diff, error = summary(scores)
+            llr = sprt_llr(scores, elo0, elo1)
+            print(f"game {index} ({'A' if index % 2 == 0 else 'B'} black, {plies} plies): "
+                  f"{'win' if score == 1 else 'draw' if score == 0.5 else 'loss'} | "
+                  f"W {wins} D {draws} L {losses}  Elo {diff:+.1f} +/- {error:.1f}  LLR {llr:.2f}")
+            if llr >= upper:
+                decision = "H1"
+            elif llr <= lower:
+                decision = "H0"
+            if decision is not None:
+                break
+    print(f"{len(scores)} games in {time.time() - t:.0f} s: "
+          + {"H1": f"SPRT accepts H1, A is at least {elo1} Elo better",
+             "H0": f"SPRT accepts H0, A is at most {elo0} Elo better",
+             None: "SPRT undecided"}[decision])
+    return decision
+
+def parse_config(arg):
+    # A JSON object of AI attributes or the name of one of tactics.CONFIGS
+    from tactics import CONFIGS
+    if arg.startswith("{"):
+        return json.loads(arg)
+    return dict(CONFIGS)[arg]
+
+if __name__ == "__main__":
+    # "python arena.py A B [key=value ...]" with A and B JSON objects of AI attributes or
+    # tactics config names, e.g. python arena.py default plain games=200 nodes=5000;
+    # keys are games, nodes, time (ms per move, instead of nodes), processes, elo0, elo1,
+    # alpha and beta. "python arena.py openings" rebuilds the opening set.
+    if sys.argv[1:] == ["openings"]:
+        build_openings()
+        sys.exit(0)
+    configs = [a for a in sys.argv[1:] if "=" not in a or a.startswith("{")]
+    options = dict(a.split("=", 1) for a in sys.argv[1:] if "=" in a and not a.startswith("{"))
+    if len(configs) != 2:
+        print("usage: python arena.py A B [games=N] [nodes=N | time=MS] [processes=N] [elo0=E] [elo1=E]")
+        sys.exit(2)
+    limits = {"time": int(options["time"])} if "time" in options else {"nodes": int(options.get("nodes", ARENA_NODES))}
+    run_arena(parse_config(configs[0]), parse_config(configs[1]),
+              int(options["games"]) if "games" in options else None, limits,
+              int(options["processes"]) if "processes" in options else None,
+              float(options.get("elo0", SPRT_ELO0)), float(options.get("elo1", SPRT_ELO1)),
+              float(options.get("alpha", SPRT_ALPHA)), float(options.get("beta", SPRT_BETA)))
@@ -0,0 +1,328 @@
+import json
+import os
+import sys
+import time
+from board import *
+from book import corpus_games
+
+# Saved results compared against by default
+BENCH_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+BENCH_DIR = "data2"                 # Corpus the positions are taken from
+BENCH_POSITIONS = 16                # Number of positions
+BENCH_PLIES = (8, 14, 20)           # Stones on the board in the positions taken from each game
+BENCH_MARGIN = 12                   # Plies a position is at least before the end of its game
+BENCH_DEPTH = 6                     # Depth of the fixed-depth search
+BENCH_NODES = 10000                 # Node limit of the fixed-node search
+BENCH_NPS_TOLERANCE = 0.15          # Slowdown of the total NPS that fails, when NPS is checked
+MEMORY_RESTARTS = 5                 # restart() calls timed by the memory check
+ALLOC_DEPTH = 4                     # Depth of the allocation check
+ALLOC_POSITIONS = 3                 # Positions of the allocation check
+WINDOW_DEPTH = 8                    # Depth of the empty window check
+WINDOW_POSITIONS = ("game0/8", "game1/8", "game2/20")  # Positions of the empty window check
+TIME_LIMITS = (300, 1000)           # Move times of the time limit check, in milliseconds
+TIME_POSITIONS = ("game4/14", "game4/20", "game7/8")  # Positions where the solvers take long
+
+def bench_positions(count=BENCH_POSITIONS, game_dir=BENCH_DIR, plies=BENCH_PLIES):
+    """Return (name, moves) of the benchmark positions.
+
+    Positions close to the end of their game are mostly solver wins that never
+    reach the main search, so they are left out, as are repeated ones. Raises
+    ValueError if game_dir has none, a benchmark of nothing would always pass.
+    """
+    positions = []
+    seen = set()
+    for i, moves in enumerate(corpus_games((game_dir,))):
+        for n in plies:
+            key = tuple(moves[:n])
+            if n + BENCH_MARGIN <= len(moves) and key not in seen:
+                seen.add(key)
+                positions.append((f"game{i}/{n}", moves[:n]))
+                if len(positions) >= count:
+                    return positions
+    if not positions:
+        raise ValueError(f"No benchmark positions in {game_dir}")
+    return positions
+
+def set_position(engine, moves):
+    """Set up a position from a clean state.
+
+    The tables, the history scores carried over from search to search and the
+    search number are reset so a position gives the same nodes and move whatever
+    was searched before it; keys come from ZOBRIST_SEED.
+    """
+    engine.restart()
+    engine.vcf.clear()
+    engine.vct.clear()
+    for h in engine.history:
+        h[:] = [0] * len(h)
+    engine.generation = 0
+    for x, y in moves:
+        engine.make_move(Pos(x + 4, y + 4))
+
+def bench_search(engine, moves, limits):
+    """Search a position from a clean state, return its record"""
+    from ai import SearchLimits
+    set_position(engine, moves)
+    depth_time = {}
+    def iteration(result):
+        depth_time[result.depth] = round(result.time, 1)
+    engine.info_callbacks.append(iteration)
+    t = time.perf_counter()
+    result = engine.search(SearchLimits(**limits))
+    elapsed = (time.perf_counter() - t) * 1000
+    engine.info_callbacks.remove(iteration)
+    return {
+        "move": list(result.move) if result.move is not None else None,
+        "score": round(result.score, 1),
+        "depth": result.depth,
+        "nodes": result.nodes,
+        "time_ms": round(elapsed, 1),
+        "nps": int(result.nodes * 1000 / max(elapsed, 1e-3)),
+        "depth_time_ms": depth_time,
+        "hash_hit_rate": round(result.hash_hits / result.hash_probes, 4) if result.hash_probes else 0.0,
+    }
+
+def run_bench(backend="cell", depth=BENCH_DEPTH, nodes=BENCH_NODES):
+    """Search every benchmark position at fixed depth and at fixed nodes, print a table and return the results"""
+    from ai import AI, BitBoardAI
+    engine = BitBoardAI() if backend == "bitboard" else AI()
+    engine.set_size(15)
+    engine.use_book = False
+    modes = [("depth", dict(depth=depth)), ("nodes", dict(nodes=nodes))]
+    results = {"backend": backend, "depth": depth, "nodes": nodes, "positions": {}, "total": {}}
+    print(f"{backend} backend, depth {depth}, {nodes} nodes")
+    print("position    mode    move     score  depth    nodes   time_ms      nps  tt_hit  time to depth")
+    for name, moves in bench_positions():
+        records = {}
+        for mode, limits in modes:
+            r = bench_search(engine, moves, limits)
+            records[mode] = r
+            move = "none" if r["move"] is None else f"[{r['move'][0]},{r['move'][1]}]"
+            ttd = " ".join(f"{d}:{t:.0f}" for d, t in r["depth_time_ms"].items())
+            print(f"{name:10s}  {mode:6s}  {move:7s}  {r['score']:>5}  {r['depth']:5d}  {r['nodes']:7d}  "
+                  f"{r['time_ms']:8.0f}  {r['nps']:7d}  {r['hash_hit_rate'] * 100:5.1f}%  {ttd}")
+        results["positions"][name] = records
+    for mode, _ in modes:
+        total_nodes = sum(p[mode]["nodes"] for p in results["positions"].values())
+        total_time = sum(p[mode]["time_ms"] for p in results["positions"].values())
+        results["total"][mode] = {"nodes": total_nodes, "time_ms": round(total_time, 1),
+                                  "nps": int(total_nodes * 1000 / max(total_time, 1e-3))}
+        print(f"total {mode}: {total_nodes} nodes {total_time:.0f} ms {results['total'][mode]['nps']} nps")
+    return results
+
+def check_windows(depth=WINDOW_DEPTH, names=WINDOW_POSITIONS):
+    """Search positions to depth counting alpha_beta() calls with alpha >= beta, True if there are none.
+
+    Such a call has an empty window, so it only costs nodes and stores bounds
+    that mean nothing in the transposition table.
+    """
+    from ai import AI
+    engine = AI()
+    engine.set_size(15)
+    engine.use_book = False
+    calls = [0, 0]
+    def alpha_beta(depth, alpha, beta, pline):
+        calls[0] += 1
+        calls[1] += alpha >= beta
+        return AI.alpha_beta(engine, depth, alpha, beta, pline)
+    engine.alpha_beta = alpha_beta
+    positions = dict(bench_positions())
+    ok = True
+    for name in names:
+        calls[:] = [0, 0]
+        r = bench_search(engine, positions[name], dict(depth=depth))
+        print(f"{name:10s}  depth {r['depth']}  {calls[0]} alpha_beta calls, {calls[1]} with alpha >= beta")
+        ok = ok and calls[1] == 0
+    print("OK" if ok else "Empty search windows")
+    return ok
+
+def check_time(limits=TIME_LIMITS, names=TIME_POSITIONS):
+    """Search positions with a time limit and with the Gomocup turn time, True if no search overruns.
+
+    A search may end MOVE_OVERHEAD ms past a time limit, the time manager keeps
+    that much of the turn time back, so it has to end within the turn time.
+    """
+    from ai import AI, SearchLimits
+    from timeman import MOVE_OVERHEAD
+    engine = AI()
+    engine.set_size(15)
+    engine.use_book = False
+    positions = dict(bench_positions())
+    ok = True
+    for name in names:
+        for ms in limits:
+            for mode in ("time", "turn"):
+                set_position(engine, positions[name])
+                engine.timeout_turn = ms
+                t = time.perf_counter()
+                result = engine.search(SearchLimits(time=ms) if mode == "time" else None)
+                elapsed = (time.perf_counter() - t) * 1000
+                late = elapsed > (ms + MOVE_OVERHEAD if mode == "time" else ms)
+                print(f"{'FAIL' if late else 'ok'} {name:10s} {mode} {ms} ms: {elapsed:.0f} ms, depth {result.depth}")
+                ok = ok and not late
+    print("OK" if ok else "Time limit exceeded")
+    return ok
+
+def check_allocations(depth=ALLOC_DEPTH, count=ALLOC_POSITIONS):
+    """Search positions to depth, print nodes per second, garbage collections and search objects created.
+
+    The speed and collections come from a plain run; a second run of the same
+    searches counts the Pos, Point, Line and MoveList objects constructed, which
+    the search should take from its preallocated buffers instead.
+    """
+    import gc
+    from ai import AI, SearchLimits
+    engine = AI()
+    engine.set_size(15)
+    engine.use_book = False
+    positions = bench_positions(count)
+    collections = [0, 0, 0]
+    def collected(phase, info):
+        if phase == "stop":
+            collections[info["generation"]] += 1
+    gc.callbacks.append(collected)
+    nodes = elapsed = 0
+    for _, moves in positions:
+        r = bench_search(engine, moves, dict(depth=depth))
+        nodes += r["nodes"]
+        elapsed += r["time_ms"]
+    gc.callbacks.remove(collected)
+
+    # Only objects constructed while searching count, not those of setting up a position
+    classes = (Pos, Point, Line, MoveList)
+    created = {cls.__name__: 0 for cls in classes}
+    searching = [False]
+    def counting(cls, init):
+        def __init__(self, *args, **kwargs):
+            if searching[0]:
+                created[cls.__name__] += 1
+            init(self, *args, **kwargs)
+        return __init__
+    saved = {cls: cls.__init__ for cls in classes}
+    for cls in classes:
+        cls.__init__ = counting(cls, saved[cls])
+    try:
+        for _, moves in positions:
+            set_position(engine, moves)
+            searching[0] = True
+            engine.search(SearchLimits(depth=depth))
+            searching[0] = False
+    finally:
+        for cls in classes:
+            cls.__init__ = saved[cls]
+    print(f"{len(positions)} positions, depth {depth}: {nodes} nodes, {nodes * 1000 / max(elapsed, 1e-3):.0f} nodes/s")
+    print(f"garbage collections by generation: {collections[0]} {collections[1]} {collections[2]}")
+    print("objects created while searching: " + " ".join(f"{n} {c}" for n, c in created.items()))
+    return created
+
+def rss_mb():
+    # Resident set size of this process now and at its peak, in MB; now is None off Linux
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    try:
+        with open("/proc/self/statm") as f:
+            now = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+    except OSError:
+        now = None
+    return now, peak
+
+def check_memory(restarts=MEMORY_RESTARTS):
+    """Print the memory of an engine and the time taken by AI() and restart()"""
+    before, _ = rss_mb()
+    from ai import AI
+    t = time.perf_counter()
+    engine = AI()
+    first = time.perf_counter() - t
+    # The pattern tables are loaded once per process, a second engine only builds its own state
+    t = time.perf_counter()
+    second_engine = AI()
+    second = time.perf_counter() - t
+    del second_engine
+    engine.set_size(15)
+    _, moves = bench_positions(1)[0]
+    elapsed = 0.0
+    for _ in range(restarts):
+        for x, y in moves:
+            engine.make_move(Pos(x + 4, y + 4))
+        t = time.perf_counter()
+        engine.restart()
+        elapsed += time.perf_counter() - t
+    now, peak = rss_mb()
+    print(f"AI(): {first * 1000:.0f} ms first, {second * 1000:.0f} ms after")
+    print(f"restart(): {elapsed * 1000 / restarts:.1f} ms with {len(moves)} stones")
+    if now is not None:
+        print(f"RSS: {before:.0f} MB before, {now:.0f} MB with the engines, {peak:.0f} MB peak")
+    else:
+        print(f"peak RSS: {peak:.0f} MB")
+
+def compare(results, baseline, tolerance=BENCH_NPS_TOLERANCE, check_nps=False):
+    """Print the differences from a baseline, return True if there are none that fail.
+
+    The searches are deterministic, so a different move or node count means the
+    search changed and the baseline has to be saved again. The speed is always
+    printed, taken from the total nodes and time of each run, but it depends on
+    the machine and its load. It only fails with check_nps, for a baseline saved
+    on the same machine, by a slowdown of more than tolerance on the totals, since
+    single positions are too noisy.
+    """
+    ok = True
+    for key in ("backend", "depth", "nodes"):
+        if results[key] != baseline.get(key):
+            print(f"FAIL baseline {key} is {baseline.get(key)}, not {results[key]}")
+            return False
+    for name, records in results["positions"].items():
+        base = baseline["positions"].get(name)
+        if base is None:
+            print(f"FAIL {name} is not in the baseline")
+            ok = False
+            continue
+        for mode, r in records.items():
+            for key in ("move", "nodes"):
+                if r[key] != base[mode][key]:
+                    print(f"FAIL {name} {mode}: {key} {base[mode][key]} -> {r[key]}")
+                    ok = False
+    for mode, total in results["total"].items():
+        base = baseline["total"][mode]
+        base_nps = int(base["nodes"] * 1000 / max(base["time_ms"], 1e-3))
+        nps = int(total["nodes"] * 1000 / max(total["time_ms"], 1e-3))
+        change = nps / base_nps - 1 if base_nps else 0.0
+        slow = check_nps and change < -tolerance
+        print(f"{'FAIL' if slow else 'ok'} {mode} nps {base_nps} -> {nps} ({change * 100:+.1f}%)"
+              + ("" if check_nps else ", not checked"))
+        ok = ok and not slow
+    print("OK" if ok else "Benchmark regression")
+    return ok
+
+if __name__ == "__main__":
+    # "python bench.py" compares moves and nodes with the baseline, "python bench.py save"
+    # writes it; add "nps" to fail on a slowdown as well, against a baseline saved on this
+    # machine, and "bitboard" to benchmark the bitboard backend instead of the Cell one.
+    # "python bench.py windows" checks that no search window is empty, "python bench.py time"
+    # that searches end within their time limit, "python bench.py alloc" counts garbage
+    # collections and objects created by the search, "python bench.py memory" measures the
+    # memory of an engine and the time of AI() and restart().
+    args = sys.argv[1:]
+    if args[:1] == ["memory"]:
+        check_memory()
+        sys.exit(0)
+    if args[:1] == ["windows"]:
+        sys.exit(0 if check_windows() else 1)
+    if args[:1] == ["time"]:
+        sys.exit(0 if check_time() else 1)
+    if args[:1] == ["alloc"]:
+        check_allocations()
+        sys.exit(0)
+    backend = "bitboard" if "bitboard" in args else "cell"
+    path = BENCH_FILE if backend == "cell" else BENCH_FILE.replace(".json", "_bitboard.json")
+    results = run_bench(backend)
+    if "save" in args:
+        with open(path, "w") as f:
+            json.dump(results, f, indent=1)
+        print(f"Saved {path}")
+    elif not os.path.exists(path):
+        print(f"No baseline {path}, run with save first")
+        sys.exit(1)
+    else:
+        with open(path) as f:
+            baseline = json.load(f)
+        sys.exit(0 if compare(results, baseline, check_nps="nps" in args) else 1)
@@ -0,0 +1,163 @@
+import json
+import os
+import random
+import sys
+from board import *
+
+# Padded board width, every line mask has one bit per padded cell
+BIT_SIZE = MAX_SIZE + 8
+WINDOW = (1 << 9) - 1
+
+def spread(window):
+    # Map a 9-cell window bit plane (centre cell removed) onto the even bits of a get_key() key
+    key = 0
+    for k in range(9):
+        if k != 4 and window >> k & 1:
+            key |= 1 << (2 * (k if k < 4 else k - 1))
+    return key
+
+# Low bit plane (black or outside) and high bit plane (not black/white) of the 2-bit piece codes
+SPREAD_LO = [spread(w) for w in range(1 << 9)]
+SPREAD_HI = [spread(WINDOW ^ w) << 1 for w in range(1 << 9)]
+
+def line_of(i, x, y):
+    # (line index, bit position) of a padded cell in direction i, following dx/dy
+    if i == 0:
+        return y, x
+    if i == 1:
+        return x, y
+    if i == 2:
+        return x - y + BIT_SIZE - 1, x
+    return x + y, x
+
+class BitBoard(Board):
+    """Board backend deriving pattern_table keys from per-colour line bitmasks.
+
+    Every row, column and diagonal of the padded board is an integer with one bit per
+    cell, kept per colour in bits[color][direction][line], plus a constant mask of the
+    cells outside the board. A 16-bit line key is a shift and mask of those integers.
+    Cell objects are still kept up to date, so the search code is unchanged.
+    """
+    def __init__(self):
+        # Line index and bit position of every padded cell in the four directions
+        self.line_at = [[[line_of(i, x, y) for y in range(BIT_SIZE)] for x in range(BIT_SIZE)]
+                        for i in range(4)]
+        self.bits = [[[0] * (2 * BIT_SIZE) for _ in range(4)] for _ in range(2)]
+        self.outside = [[(1 << BIT_SIZE) - 1] * (2 * BIT_SIZE) for _ in range(4)]
+        super().__init__()
+
+    def set_size(self, size):
+        super().set_size(size)
+        self.bits = [[[0] * (2 * BIT_SIZE) for _ in range(4)] for _ in range(2)]
+        self.outside = [[(1 << BIT_SIZE) - 1] * (2 * BIT_SIZE) for _ in range(4)]
+        for i in range(4):
+            for x in range(self.b_start, self.b_end):
+                for y in range(self.b_start, self.b_end):
+                    line, pos = self.line_at[i][x][y]
+                    self.outside[i][line] &= ~(1 << pos)
+
+    def make_move(self, next_pos):
+        x, y = next_pos.x, next_pos.y
+        bits = self.bits[self.who]
+        for i in range(4):
+            line, pos = self.line_at[i][x][y]
+            bits[i][line] |= 1 << pos
+        super().make_move(next_pos)
+
+    def del_move(self):
+        # Clear the bits before Board.del_move() recomputes the neighbour patterns
+        x, y = self.rem_move[self.step - 1].x, self.rem_move[self.step - 1].y
+        bits = self.bits[self.opp]
+        for i in range(4):
+            line, pos = self.line_at[i][x][y]
+            bits[i][line] &= ~(1 << pos)
+        super().del_move()
+
+    def get_key(self, x, y, i):
+        line, pos = self.line_at[i][x][y]
+        black = self.bits[Pieces.BLACK.value][i][line]
+        white = self.bits[Pieces.WHITE.value][i][line]
+        shift = pos - 4
+        return (SPREAD_LO[((black | self.outside[i][line]) >> shift) & WINDOW] |
+                SPREAD_HI[((black | white) >> shift) & WINDOW])
+
+    def update_type(self, x, y):
+        black_bits = self.bits[Pieces.BLACK.value]
+        white_bits = self.bits[Pieces.WHITE.value]
+        for i in range(4):
+            line, pos = self.line_at[i][x][y]
+            out = self.outside[i][line]
+            lo = black_bits[i][line] | out
+            hi = black_bits[i][line] | white_bits[i][line]
+            step_x, step_y = dx[i], dy[i]
+
+            # Update in positive then negative direction, stopping at the board edge
+            for sign in (1, -1):
+                a, b = x, y
+                for k in range(1, 5):
+                    q = pos + sign * k
+                    if out >> q & 1:
+                        break
+                    a, b = a + sign * step_x, b + sign * step_y
+                    self.set_pattern(self.cell[a][b], i,
+                                     SPREAD_LO[(lo >> (q - 4)) & WINDOW] | SPREAD_HI[(hi >> (q - 4)) & WINDOW])
+
+def cross_check(board, reference, verbose=False):
+    """Return a list of mismatches between the keys and patterns of two boards"""
+    errors = []
+    for x in range(board.b_start, board.b_end):
+        for y in range(board.b_start, board.b_end):
+            if board.cell[x][y].piece != reference.cell[x][y].piece:
+                errors.append(f"piece at ({x},{y})")
+            for i in range(4):
+                if board.get_key(x, y, i) != reference.get_key(x, y, i):
+                    errors.append(f"key at ({x},{y}) dir {i}")
+            if board.cell[x][y].pattern != reference.cell[x][y].pattern:
+                errors.append(f"pattern at ({x},{y})")
+    if board.type_hist != reference.type_hist or board.block4_cells != reference.block4_cells:
+        errors.append("type histogram")
+    scan = [pack_pos(x, y) for x in range(board.b_start, board.b_end) for y in range(board.b_start, board.b_end)
+            if reference.cell[x][y].is_cand > 0 and reference.cell[x][y].piece == EMPTY]
+    if sorted(board.cand_list) != scan or sorted(reference.cand_list) != scan:
+        errors.append("candidate list")
+    if verbose:
+        for e in errors:
+            print("mismatch:", e)
+    return errors
+
+def cross_check_games(game_dir="data2", num_games=50, size=15, seed=0):
+    """Replay corpus games on both backends, with random take-backs, comparing every cell"""
+    rng = random.Random(seed)
+    board, reference = BitBoard(), Board()
+    files = sorted(f for f in os.listdir(game_dir) if f.startswith("game_"))[:num_games]
+    checked = 0
+    for name in files:
+        with open(os.path.join(game_dir, name)) as f:
+            game = json.load(f)
+        if not game:
+            continue
+        moves = [game[0]["board_state"][0]] + [e["next_move"] for e in game]
+
+        for b in (board, reference):
+            b.restart()
+            b.set_size(size)
+        for m in moves:
+            m = abs(m)
+            for b in (board, reference):
+                b.make_move(Pos(m % size + 4, m // size + 4))
+            # Take a move back now and then to exercise del_move() as well
+            if rng.random() < 0.2:
+                for b in (board, reference):
+                    b.del_move()
+                for b in (board, reference):
+                    b.make_move(Pos(m % size + 4, m // size + 4))
+            errors = cross_check(board, reference, verbose=True)
+            if errors:
+                print(f"{name}: {len(errors)} mismatches after {board.step} moves")
+                return False
+            checked += 1
+    print(f"Cross-checked {checked} positions from {len(files)} games: OK")
+    return True
+
+if __name__ == "__main__":
+    sys.exit(0 if cross_check_games() else 1)
@@ -1,5 +1,8 @@
+import hashlib
+import os
 import random
-import time
+import sys
+from array import array
 from enum import Enum
 
 # Constants
@@ -13,10 +16,16 @@ BLOCK2 = 1       # Blocked two
 NTYPE = 8        # Number of pattern types
 MAX_SIZE = 20    # Maximum board size
 MAX_MOVES = 40   # Maximum number of moves per layer
-HASH_SIZE = 1 << 22  # Normal hash table size
-PVS_SIZE = 1 << 20   # PVS hash table size
+HASH_SIZE = 1 << 22  # Transposition table entries
+HASH_WAYS = 2        # Entries per bucket: depth-preferred, then always-replace
 MAX_DEPTH = 20   # Maximum search depth
 MIN_DEPTH = 4    # Minimum search depth (increased from 2)
+ZOBRIST_SEED = 0x5EED  # Fixed, so keys agree between runs and processes
+
+# Pattern table cache, bump PATTERN_VERSION when the file layout changes
+PATTERN_VERSION = 1
+PATTERN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pattern_table.bin")
+PATTERN_MAGIC = b"WPAT"
 
 # Hash related constants
 HASH_EXACT = 0
@@ -35,40 +44,74 @@ class Pieces(Enum):
     EMPTY = 2
     OUTSIDE = 3
 
+# Plain int copies of the piece values for hot paths, Enum attribute access is slow
+EMPTY = Pieces.EMPTY.value
+OUTSIDE = Pieces.OUTSIDE.value
+
 class Pos:
+    __slots__ = ("x", "y")
+
     def __init__(self, x=-1, y=-1):
         self.x = x
         self.y = y
 
 class Point:
+    __slots__ = ("p", "val")
+
     def __init__(self, p=None, val=0):
         self.p = p if p is not None else Pos()
         self.val = val
 
+def pack_pos(x, y):
+    # Cell (0, 0) is always outside the board, so 0 can mean "no move"
+    return (x << 5) | y
+
+# Pattern tables shared by every Board in the process: (type_table, pattern_table, pval)
+_chess_tables = None
+
+def zobrist_table(seed=ZOBRIST_SEED):
+    # Random key of every colour and padded cell, the same for every Board
+    rng = random.Random(seed)
+    return [[[rng.getrandbits(64) for _ in range(MAX_SIZE + 4)] for _ in range(MAX_SIZE + 4)] for _ in range(2)]
+
+# Symmetry undoing each of the 8 of sym_transform()
+SYM_INVERSE = [0, 1, 2, 3, 4, 6, 5, 7]
+
+def sym_transform(s, x, y, n):
+    # One of the 8 symmetries of an n x n board in unpadded coordinates: bit 2 swaps
+    # the axes, then bits 0 and 1 mirror the first and second coordinate
+    if s & 4:
+        x, y = y, x
+    if s & 1:
+        x = n - 1 - x
+    if s & 2:
+        y = n - 1 - y
+    return x, y
+
+def clear_table(table):
+    # Zero a packed array in place without reallocating it
+    view = memoryview(table).cast('B')
+    view[:] = bytes(len(view))
+
 class Cell:
+    __slots__ = ("piece", "is_cand", "cand_index", "pattern")
+
     def __init__(self):
         self.piece = Pieces.EMPTY.value
         self.is_cand = 0
+        self.cand_index = -1  # Position in Board.cand_list, -1 when not a candidate
         self.pattern = [[0, 0, 0, 0], [0, 0, 0, 0]]  # Black and white patterns in 4 directions
 
-class Hashe:
-    def __init__(self):
-        self.key = 0
-        self.depth = 0
-        self.hashf = 0
-        self.val = 0
-
-class Pv:
-    def __init__(self):
-        self.key = 0
-        self.best = Pos()
-
 class Line:
+    __slots__ = ("n", "moves")
+
     def __init__(self):
         self.n = 0
         self.moves = [Pos() for _ in range(MAX_DEPTH)]
 
 class MoveList:
+    __slots__ = ("phase", "n", "index", "first", "hash_move", "moves")
+
     def __init__(self):
         self.phase = 0
         self.n = 0
@@ -84,35 +127,85 @@ class Board:
         self.b_start = 0
         self.b_end = 0
         self.zobrist_key = 0
-        self.zobrist = [[[0 for _ in range(MAX_SIZE + 4)] for _ in range(MAX_SIZE + 4)] for _ in range(2)]
-        self.hash_table = [Hashe() for _ in range(HASH_SIZE)]
-        self.pvs_table = [Pv() for _ in range(PVS_SIZE)]
-        self.type_table = [[[[0 for _ in range(3)] for _ in range(6)] for _ in range(6)] for _ in range(10)]
-        self.pattern_table = [[0, 0] for _ in range(65536)]
-        self.pval = [[[[0 for _ in range(8)] for _ in range(8)] for _ in range(8)] for _ in range(8)]
+        self.zobrist = None
+        # Optional keys of all 8 symmetric images of the position, sym_keys[0] is zobrist_key.
+        # Per board size, sym_zobrist[who][pack_pos(x, y)] holds the 8 keys of a stone and
+        # sym_pos[s][pack_pos(x, y)] the image of a cell under symmetry s.
+        self.use_symmetry = False
+        self.sym_keys = [0] * 8
+        self.sym_zobrist = None
+        self.sym_pos = None
+        # Transposition table, one key and one data word per slot. The data word packs
+        # the value in tenths (bits 0-31, signed), the best move as pack_pos() (32-47,
+        # 0 = none), the depth (48-55), the bound (56-57) and the generation of the
+        # search that wrote it (58-63, 0 = empty slot). See AI.probe_hash().
+        self.hash_key = array('Q', bytes(8 * HASH_SIZE))
+        self.hash_data = array('Q', bytes(8 * HASH_SIZE))
+        self.type_table = None     # Shared read-only tables, set by init_chess_type()
+        self.pattern_table = None
+        self.pval = None
         self.cell = [[Cell() for _ in range(MAX_SIZE + 8)] for _ in range(MAX_SIZE + 8)]
         self.rem_move = [Pos() for _ in range(MAX_SIZE * MAX_SIZE)]
-        self.cand = [Point() for _ in range(256)]
+        self.cand = [Point() for _ in range(MAX_SIZE * MAX_SIZE)]
         self.is_lose = [[False for _ in range(MAX_SIZE + 4)] for _ in range(MAX_SIZE + 4)]
         self.who = Pieces.BLACK.value
         self.opp = Pieces.WHITE.value
         self.root_move = [Point() for _ in range(64)]
         self.root_count = 0
         self.ply = 0
+        # Pattern type counts over empty candidate cells per colour, kept up to date by
+        # make_move/del_move, and how many of those cells hold two or more BLOCK4s
+        self.type_hist = [[0] * NTYPE, [0] * NTYPE]
+        self.block4_cells = [0, 0]
+        # Empty cells with is_cand > 0 as pack_pos(x, y), with O(1) add/remove through Cell.cand_index
+        self.cand_list = []
+        # One shared Pos per pack_pos() value, pos_table[0] is the "no move" Pos(-1, -1).
+        # The search passes these around instead of allocating, so they must not be mutated.
+        self.pos_table = [Pos(v >> 5, v & 31) for v in range(1 << 10)]
+        self.pos_table[0] = Pos()
+        # Per-ply search buffers, indexed by self.ply
+        self.line_stack = [Line() for _ in range(MAX_DEPTH + 1)]
+        self.move_stack = [MoveList() for _ in range(MAX_DEPTH + 1)]
+        self.root_moves = [Pos() for _ in range(64)]
 
         self.init_chess_type()
         self.init_zobrist()
 
-    def rand64(self):
-        # Generate a 64-bit random number
-        return random.randint(0, (1 << 64) - 1)
-
     def init_zobrist(self):
-        random.seed(time.time())
-        for i in range(MAX_SIZE + 4):
-            for j in range(MAX_SIZE + 4):
-                self.zobrist[0][i][j] = self.rand64()
-                self.zobrist[1][i][j] = self.rand64()
+        self.zobrist = zobrist_table()
+        self.init_symmetry()
+
+    def init_symmetry(self):
+        # Symmetry tables of the current board size
+        n = self.size
+        self.sym_pos = [[0] * (1 << 10) for _ in range(8)]
+        self.sym_zobrist = [[None] * (1 << 10) for _ in range(2)]
+        for x in range(n):
+            for y in range(n):
+                v = pack_pos(x + 4, y + 4)
+                for s in range(8):
+                    tx, ty = sym_transform(s, x, y, n)
+                    self.sym_pos[s][v] = pack_pos(tx + 4, ty + 4)
+                for who in range(2):
+                    self.sym_zobrist[who][v] = [self.zobrist[who][self.sym_pos[s][v] >> 5][self.sym_pos[s][v] & 31]
+                                                for s in range(8)]
+
+    def set_symmetry(self, on):
+        """Turn the upkeep of the 8 symmetric keys on or off"""
+        self.use_symmetry = on
+        self.sym_keys = [0] * 8
+        if on:
+            for i in range(self.step):
+                who = Pieces.BLACK.value ^ (i & 1)
+                keys = self.sym_zobrist[who][pack_pos(self.rem_move[i].x, self.rem_move[i].y)]
+                self.sym_keys = [a ^ b for a, b in zip(self.sym_keys, keys)]
+
+    def canonical_key(self):
+        """Return (key, symmetry): the smallest key over the 8 images and the symmetry giving it"""
+        if not self.use_symmetry:
+            return self.zobrist_key, 0
+        key = min(self.sym_keys)
+        return key, self.sym_keys.index(key)
 
     def set_size(self, size):
         self.size = size
@@ -123,12 +216,22 @@ class Board:
                     self.cell[i][j].piece = Pieces.OUTSIDE.value
                 else:
                     self.cell[i][j].piece = Pieces.EMPTY.value
+                self.cell[i][j].cand_index = -1
+        self.init_symmetry()
+        self.type_hist = [[0] * NTYPE, [0] * NTYPE]
+        self.block4_cells = [0, 0]
+        self.cand_list = []
 
     def make_move(self, next_pos):
         x, y = next_pos.x, next_pos.y
         self.ply += 1
-        self.cell[x][y].piece = self.who
+        c = self.cell[x][y]
+        if c.is_cand > 0:
+            self.remove_cand(c)
+        c.piece = self.who
         self.zobrist_key ^= self.zobrist[self.who][x][y]
+        if self.use_symmetry:
+            self.sym_keys = [a ^ b for a, b in zip(self.sym_keys, self.sym_zobrist[self.who][(x << 5) | y])]
         self.who, self.opp = self.opp, self.who
         self.rem_move[self.step] = next_pos
         self.step += 1
@@ -137,21 +240,48 @@ class Board:
         for i in range(x - 2, x + 3):
             for j in range(y - 2, y + 3):
                 if self.check_xy(i, j):
-                    self.cell[i][j].is_cand += 1
+                    c = self.cell[i][j]
+                    c.is_cand += 1
+                    if c.is_cand == 1 and c.piece == EMPTY:
+                        self.add_cand(c, i, j)
 
     def del_move(self):
         self.step -= 1
         x, y = self.rem_move[self.step].x, self.rem_move[self.step].y
         self.ply -= 1
-        self.who, self.opp = self.opp, self.who
-        self.zobrist_key ^= self.zobrist[self.who][x][y]
-        self.cell[x][y].piece = Pieces.EMPTY.value
-        self.update_type(x, y)
 
+        # Drop cells that stop being candidates while they still hold the counted patterns
         for i in range(x - 2, x + 3):
             for j in range(y - 2, y + 3):
                 if self.check_xy(i, j):
-                    self.cell[i][j].is_cand -= 1
+                    c = self.cell[i][j]
+                    c.is_cand -= 1
+                    if c.is_cand == 0 and c.piece == EMPTY:
+                        self.remove_cand(c)
+
+        self.who, self.opp = self.opp, self.who
+        self.zobrist_key ^= self.zobrist[self.who][x][y]
+        if self.use_symmetry:
+            self.sym_keys = [a ^ b for a, b in zip(self.sym_keys, self.sym_zobrist[self.who][(x << 5) | y])]
+        c = self.cell[x][y]
+        c.piece = EMPTY
+        self.update_type(x, y)
+        if c.is_cand > 0:
+            self.add_cand(c, x, y)
+
+    def add_cand(self, c, x, y):
+        c.cand_index = len(self.cand_list)
+        self.cand_list.append(pack_pos(x, y))
+        self.count_cell(c, 1)
+
+    def remove_cand(self, c):
+        # Swap the last candidate into the freed slot
+        last = self.cand_list.pop()
+        if c.cand_index < len(self.cand_list):
+            self.cand_list[c.cand_index] = last
+            self.cell[last >> 5][last & 31].cand_index = c.cand_index
+        c.cand_index = -1
+        self.count_cell(c, -1)
 
     def undo(self):
         if self.step >= 2:
@@ -161,8 +291,8 @@ class Board:
             self.del_move()
 
     def restart(self):
-        self.pvs_table = [Pv() for _ in range(PVS_SIZE)]
-        self.hash_table = [Hashe() for _ in range(HASH_SIZE)]
+        for table in (self.hash_key, self.hash_data):
+            clear_table(table)
         while self.step:
             self.del_move()
 
@@ -173,9 +303,7 @@ class Board:
             for j in range(4):
                 if not self.check_xy(a, b):
                     break
-                key = self.get_key(a, b, i)
-                self.cell[a][b].pattern[0][i] = self.pattern_table[key][0]
-                self.cell[a][b].pattern[1][i] = self.pattern_table[key][1]
+                self.set_pattern(self.cell[a][b], i, self.get_key(a, b, i))
                 a, b = a + dx[i], b + dy[i]
 
             # Update in negative direction
@@ -183,11 +311,45 @@ class Board:
             for j in range(4):
                 if not self.check_xy(a, b):
                     break
-                key = self.get_key(a, b, i)
-                self.cell[a][b].pattern[0][i] = self.pattern_table[key][0]
-                self.cell[a][b].pattern[1][i] = self.pattern_table[key][1]
+                self.set_pattern(self.cell[a][b], i, self.get_key(a, b, i))
                 a, b = a - dx[i], b - dy[i]
 
+    def set_pattern(self, c, i, key):
+        new = self.pattern_table[key]
+        if c.is_cand == 0 or c.piece != EMPTY:
+            c.pattern[0][i] = new[0]
+            c.pattern[1][i] = new[1]
+            return
+        
+        # Empty candidates are part of type_hist, move their counts to the new pattern
+        for role in range(2):
+            p = c.pattern[role]
+            old, t = p[i], new[role]
+            if old == t:
+                continue
+            hist = self.type_hist[role]
+            hist[old] -= 1
+            hist[t] += 1
+            if old == BLOCK4 or t == BLOCK4:
+                n = (p[0] == BLOCK4) + (p[1] == BLOCK4) + (p[2] == BLOCK4) + (p[3] == BLOCK4)
+                if old == BLOCK4 and n == 2:
+                    self.block4_cells[role] -= 1
+                elif t == BLOCK4 and n == 1:
+                    self.block4_cells[role] += 1
+            p[i] = t
+
+    def count_cell(self, c, sign):
+        # Add (sign=1) or remove (sign=-1) a candidate cell's patterns from type_hist
+        for role in range(2):
+            p = c.pattern[role]
+            hist = self.type_hist[role]
+            hist[p[0]] += sign
+            hist[p[1]] += sign
+            hist[p[2]] += sign
+            hist[p[3]] += sign
+            if (p[0] == BLOCK4) + (p[1] == BLOCK4) + (p[2] == BLOCK4) + (p[3] == BLOCK4) >= 2:
+                self.block4_cells[role] += sign
+
     def get_key(self, x, y, i):
         step_x, step_y = dx[i], dy[i]
         key = (self.cell[x - step_x * 4][y - step_y * 4].piece) ^ \
@@ -353,7 +515,18 @@ class Board:
         return score
 
     def init_chess_type(self):
+        # Tables are built once per process, and once per generator version on disk
+        global _chess_tables
+        if _chess_tables is None:
+            _chess_tables = self.load_chess_type()
+            if _chess_tables is None:
+                _chess_tables = self.build_chess_type()
+                self.save_chess_type(_chess_tables)
+        self.type_table, self.pattern_table, self.pval = _chess_tables
+
+    def build_chess_type(self):
         # Chess type judgment auxiliary table
+        self.type_table = [[[[0 for _ in range(3)] for _ in range(6)] for _ in range(6)] for _ in range(10)]
         for i in range(10):
             for j in range(6):
                 for k in range(6):
@@ -361,23 +534,95 @@ class Board:
                         self.type_table[i][j][k][l] = self.generate_assist(i, j, k, l)
         
         # Pattern table
-        for key in range(65536):
-            self.pattern_table[key][0] = self.line_type(0, key)
-            self.pattern_table[key][1] = self.line_type(1, key)
+        pattern_table = [(self.line_type(0, key), self.line_type(1, key)) for key in range(65536)]
         
         # Move evaluation table
+        pval = [[[[0 for _ in range(8)] for _ in range(8)] for _ in range(8)] for _ in range(8)]
         for i in range(8):
             for j in range(8):
                 for k in range(8):
                     for l in range(8):
-                        self.pval[i][j][k][l] = self.get_pval(i, j, k, l)
+                        pval[i][j][k][l] = self.get_pval(i, j, k, l)
+        
+        return self.type_table, pattern_table, pval
+
+    def chess_type_checksum(self):
+        # Fingerprint of the code that generates the tables, a stale cache is rebuilt
+        h = hashlib.sha256(b"%d" % PATTERN_VERSION)
+        h.update(repr([WIN, FLEX4, BLOCK4, FLEX3, BLOCK3, FLEX2, BLOCK2, [p.value for p in Pieces]]).encode())
+        codes = [f.__code__ for f in (Board.build_chess_type, Board.generate_assist, Board.line_type,
+                                      Board.short_line, Board.check_flex3, Board.check_flex4, Board.get_pval)]
+        while codes:
+            code = codes.pop()
+            h.update(code.co_code)
+            h.update(repr(code.co_names).encode())
+            for const in code.co_consts:
+                # Comprehensions are nested code objects whose repr holds an address
+                if hasattr(const, "co_code"):
+                    codes.append(const)
+                else:
+                    h.update(repr(const).encode())
+        return h.digest()
+
+    def load_chess_type(self):
+        try:
+            with open(PATTERN_FILE, "rb") as f:
+                raw = f.read()
+        except OSError:
+            return None
+        
+        header = PATTERN_MAGIC + self.chess_type_checksum()
+        if len(raw) != len(header) + 2 * 65536 + 2 * 4096 + 1080 or not raw.startswith(header):
+            return None
+        
+        off = len(header)
+        keys = raw[off:off + 2 * 65536]
+        pattern_table = list(zip(keys[0::2], keys[1::2]))
+        off += 2 * 65536
+        
+        flat = array('h', raw[off:off + 2 * 4096])
+        if sys.byteorder != "little":
+            flat.byteswap()
+        pval = [[[flat[((i * 8 + j) * 8 + k) * 8:((i * 8 + j) * 8 + k + 1) * 8].tolist()
+                  for k in range(8)] for j in range(8)] for i in range(8)]
+        off += 2 * 4096
+        
+        flat = raw[off:]
+        type_table = [[[list(flat[((i * 6 + j) * 6 + k) * 3:((i * 6 + j) * 6 + k + 1) * 3])
+                        for k in range(6)] for j in range(6)] for i in range(10)]
+        
+        return type_table, pattern_table, pval
+
+    def save_chess_type(self, tables):
+        type_table, pattern_table, pval = tables
+        keys = bytes(v for pair in pattern_table for v in pair)
+        flat = array('h', [v for a in pval for b in a for c in b for v in c])
+        if sys.byteorder != "little":
+            flat.byteswap()
+        types = bytes(v for a in type_table for b in a for c in b for v in c)
+        
+        # Write to a temporary file first so concurrent engines never read a torn cache
+        tmp = "%s.%d.tmp" % (PATTERN_FILE, os.getpid())
+        try:
+            with open(tmp, "wb") as f:
+                f.write(PATTERN_MAGIC + self.chess_type_checksum())
+                f.write(keys)
+                f.write(flat.tobytes())
+                f.write(types)
+            os.replace(tmp, PATTERN_FILE)
+        except OSError:
+            # Read-only install, keep using the in-memory tables
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
 
     # Helper methods
     def color(self, step):
         return step & 1
 
     def check_xy(self, x, y):
-        return self.cell[x][y].piece != Pieces.OUTSIDE.value
+        return self.cell[x][y].piece != OUTSIDE
 
     def last_move(self):
         return self.cell[self.rem_move[self.step - 1].x][self.rem_move[self.step - 1].y]
@@ -0,0 +1,180 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from board import *
+
+BOOK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "book.bin")
+BOOK_MAGIC = b"WBOK"
+BOOK_VERSION = 2
+BOOK_HEADER = struct.Struct("<4sHHI")  # Magic, version, board size, record count
+BOOK_DIRS = ("data2", "gomoku_data", "data1000")
+BOOK_SIZE = 15        # Board size of the corpus games
+BOOK_PLIES = 10       # Positions with fewer stones are looked up
+BOOK_MIN_GAMES = 3    # Games a move needs behind it to be stored and played
+
+# The board's own keys, so Board.canonical_key() finds positions directly
+BOOK_ZOBRIST = zobrist_table()
+
+def canonical(stones):
+    """Return (key, symmetry) of a list of (x, y) stones in play order.
+
+    The key is the smallest one over the 8 symmetric images, the symmetry maps
+    board coordinates into the frame the book stores moves in. Both are what
+    Board.canonical_key() gives for the same position.
+    """
+    keys = [0] * 8
+    for i, (x, y) in enumerate(stones):
+        table = BOOK_ZOBRIST[Pieces.BLACK.value ^ (i & 1)]
+        for s in range(8):
+            tx, ty = sym_transform(s, x, y, BOOK_SIZE)
+            keys[s] ^= table[tx + 4][ty + 4]
+    key = min(keys)
+    return key, keys.index(key)
+
+class OpeningBook:
+    """Move statistics of opening positions, read from a sorted file.
+
+    The file is the header, then the 64-bit keys of all records in ascending
+    order, then four 16-bit words per record: the move (y * size + x, in the
+    canonical frame), games, wins and draws of the side playing it. A position
+    owns a run of records with the same key, found by binary search on the
+    memory-mapped key array.
+    """
+    def __init__(self, path=BOOK_FILE):
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.size, n = BOOK_HEADER.unpack_from(self.mm)
+        if magic != BOOK_MAGIC or version != BOOK_VERSION:
+            raise ValueError("not an opening book: " + path)
+        if len(self.mm) != BOOK_HEADER.size + 16 * n:
+            raise ValueError("truncated opening book: " + path)
+        self.count = n
+        off = BOOK_HEADER.size
+        view = memoryview(self.mm)
+        if sys.byteorder == "little":
+            self.keys = view[off:off + 8 * n].cast('Q')
+            self.data = view[off + 8 * n:].cast('H')
+        else:
+            self.keys = array('Q', view[off:off + 8 * n])
+            self.data = array('H', view[off + 8 * n:])
+            self.keys.byteswap()
+            self.data.byteswap()
+
+    @staticmethod
+    def load(path=BOOK_FILE):
+        """Open the book at path, or return None if there is no usable one"""
+        try:
+            return OpeningBook(path)
+        except (OSError, ValueError):
+            return None
+
+    def probe(self, stones):
+        """Return [(x, y, games, wins, draws)] for a position, moves in board coordinates"""
+        if len(stones) >= BOOK_PLIES:
+            return []
+        return self.probe_key(*canonical(stones))
+
+    def probe_key(self, key, s):
+        """Same as probe(), for a position given by its canonical key and symmetry"""
+        i = bisect_left(self.keys, key)
+        moves = []
+        back = SYM_INVERSE[s]
+        while i < self.count and self.keys[i] == key:
+            v, games, wins, draws = self.data[4 * i:4 * i + 4]
+            x, y = sym_transform(back, v % self.size, v // self.size, self.size)
+            moves.append((x, y, games, wins, draws))
+            i += 1
+        return moves
+
+    def choose(self, stones):
+        """Return the (x, y) with the best score over enough games, or None"""
+        if len(stones) >= BOOK_PLIES:
+            return None
+        return self.choose_key(*canonical(stones))
+
+    def choose_key(self, key, s):
+        """Same as choose(), for a position given by its canonical key and symmetry"""
+        best, best_score = None, -1
+        for x, y, games, wins, draws in self.probe_key(key, s):
+            if games < BOOK_MIN_GAMES:
+                continue
+            # One won and one lost game of prior keeps rarely played moves modest
+            score = (wins + draws / 2 + 1) / (games + 2)
+            if score > best_score:
+                best, best_score = (x, y), score
+        return best
+
+def corpus_games(dirs=BOOK_DIRS):
+    # Move lists of the recorded games, as (x, y) in play order. Relative directories
+    # are taken from the one of this file, not the working directory.
+    for d in dirs:
+        d = os.path.join(os.path.dirname(os.path.abspath(__file__)), d)
+        if not os.path.isdir(d):
+            continue
+        for name in sorted(f for f in os.listdir(d) if f.startswith("game_") and f.endswith(".json")):
+            with open(os.path.join(d, name)) as f:
+                game = json.load(f)
+            if not game:
+                continue
+            moves = [game[0]["board_state"][0]] + [e["next_move"] for e in game]
+            yield [(abs(m) % BOOK_SIZE, abs(m) // BOOK_SIZE) for m in moves]
+
+def build_book(dirs=BOOK_DIRS, path=BOOK_FILE, plies=BOOK_PLIES, min_games=BOOK_MIN_GAMES):
+    """Count the moves played in the opening positions of the corpus games and write the book.
+
+    Only JSON games are read, the .npy and .pkl datasets are converted from the same
+    games by data_generator.py.
+    """
+    board = Board()
+    stats = {}
+    num_games = 0
+    for moves in corpus_games(dirs):
+        # The generator stops at a five, so the last mover won unless the board filled up
+        while board.step:
+            board.del_move()
+        board.set_size(BOOK_SIZE)
+        for x, y in moves:
+            board.make_move(Pos(x + 4, y + 4))
+        winner = (len(moves) - 1) & 1 if board.check_win() else -1
+        num_games += 1
+
+        for k in range(min(plies, len(moves))):
+            key, s = canonical(moves[:k])
+            x, y = sym_transform(s, *moves[k], BOOK_SIZE)
+            entry = stats.setdefault(key, {}).setdefault(y * BOOK_SIZE + x, [0, 0, 0])
+            entry[0] += 1
+            if winner == k & 1:
+                entry[1] += 1
+            elif winner == -1:
+                entry[2] += 1
+
+    records = sorted((key, move, min(g, 65535), min(w, 65535), min(d, 65535))
+                     for key, moves in stats.items() for move, (g, w, d) in moves.items()
+                     if g >= min_games)
+    keys = array('Q', [r[0] for r in records])
+    data = array('H', [v for r in records for v in r[1:]])
+    if sys.byteorder != "little":
+        keys.byteswap()
+        data.byteswap()
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, "wb") as f:
+        f.write(BOOK_HEADER.pack(BOOK_MAGIC, BOOK_VERSION, BOOK_SIZE, len(records)))
+        f.write(keys.tobytes())
+        f.write(data.tobytes())
+    os.replace(tmp, path)
+    print(f"{num_games} games, {len(stats)} positions, {len(records)} moves with {min_games}+ games -> {path}")
+
+if __name__ == "__main__":
+    build_book()
+    book = OpeningBook(BOOK_FILE)
+    # Lookup cost for a position at the book horizon
+    stones = next(corpus_games())[:BOOK_PLIES - 1]
+    t = time.perf_counter()
+    for _ in range(1000):
+        book.choose(stones)
+    print(f"{book.count} records, {(time.perf_counter() - t) * 1000:.0f} us per lookup")
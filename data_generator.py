@@ -7,6 +7,8 @@ import random
 from datetime import datetime
 from ai import AI, Pos
 
+POLICY_TEMPERATURE = 100  # Score difference that makes a move e times less likely in policy labels
+
 def coord_to_base15(x, y):
     """Convert (x,y) coordinates to a base-15 number"""
     return y * 15 + x
@@ -15,14 +17,27 @@ def base15_to_coord(num):
     """Convert a base-15 number back to (x,y) coordinates"""
     return num % 15, num // 15
 
-def generate_game_data(game_id, max_moves=225):
-    """Generate training data from a single game"""
+def policy_label(lines, sign):
+    """Soft policy over MultiPV lines: [[signed base-15 move, probability], ...]"""
+    top = max(score for _, score, _ in lines)
+    weights = [np.exp((score - top) / POLICY_TEMPERATURE) for _, score, _ in lines]
+    total = sum(weights)
+    return [[sign * coord_to_base15(*move), float(w / total)] for (move, _, _), w in zip(lines, weights)]
+
+def generate_game_data(game_id, max_moves=225, limits=None, multi_pv=1):
+    """Generate training data from a single game, every move searched within limits (an ai.SearchLimits).
+
+    With multi_pv > 1 every example also gets a "policy" label over the best multi_pv moves.
+    """
     # Initialize AI
     ai = AI()
     ai.set_size(15)
+    ai.use_book = False  # The book is built from these games, new ones must not just replay it
+    ai.multi_pv = multi_pv
     
     # Lists to store moves and board states
     moves = []
+    policies = []
     board_states = []
     current_player = 1  # 1 for black (first player), -1 for white
     
@@ -43,8 +58,8 @@ def generate_game_data(game_id, max_moves=225):
             board_states.append(board_state.copy())
         
         # Get AI's move
-        result = ai.get_best_move()
-        x, y = result.x, result.y
+        result = ai.search(limits)
+        x, y = result.move
         
         # Convert move to base-15 and store
         move_base15 = coord_to_base15(x, y)
@@ -53,9 +68,10 @@ def generate_game_data(game_id, max_moves=225):
             
         if move_num > 0:  # Skip first move for labels
             moves.append(move_base15)
+            policies.append(policy_label(result.lines, current_player))
             
         # Make the move
-        ai.put_chess(result)
+        ai.put_chess(Pos(x, y))
         
         # Check for win
         if ai.check_win():
@@ -73,20 +89,22 @@ def generate_game_data(game_id, max_moves=225):
                 "board_state": board_states[i],
                 "next_move": moves[i]
             }
+            if multi_pv > 1:
+                example["policy"] = policies[i]
             training_data.append(example)
     
     return training_data
 
 def worker(args):
     """Worker function for parallel processing"""
-    game_id, output_dir, worker_id = args
+    game_id, output_dir, worker_id, limits, multi_pv = args
     try:
         # Add some randomness to initial moves
         if random.random() < 0.3:
             # Different worker seeds to ensure diverse games
             random.seed(time.time() + worker_id)
             
-        data = generate_game_data(game_id)
+        data = generate_game_data(game_id, limits=limits, multi_pv=multi_pv)
         
         # Save to individual JSON file
         filename = os.path.join(output_dir, f"game_{game_id}.json")
@@ -98,8 +116,9 @@ def worker(args):
         print(f"Error in game {game_id}: {str(e)}")
         return game_id, 0
 
-def generate_training_data(num_games=100, output_dir="training_data", num_processes=None):
-    """Generate training data from multiple games in parallel"""
+def generate_training_data(num_games=100, output_dir="training_data", num_processes=None, limits=None,
+                           multi_pv=1):
+    """Generate training data from multiple games in parallel, limits and multi_pv as in generate_game_data"""
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
     
@@ -110,7 +129,7 @@ def generate_training_data(num_games=100, output_dir="training_data", num_proces
     print(f"Generating {num_games} games using {num_processes} processes...")
     
     # Prepare arguments for workers
-    args_list = [(i, output_dir, i % num_processes) for i in range(num_games)]
+    args_list = [(i, output_dir, i % num_processes, limits, multi_pv) for i in range(num_games)]
     
     # Set up multiprocessing pool
     pool = multiprocessing.Pool(processes=num_processes)
@@ -64,6 +64,9 @@ def computer_vs_computer_demo():
         while True:
             # First AI's move (Black)
             result = wine.get_best_move()
+            if result is None:
+                print("\nThe board is full, the game is a draw.")
+                break
             # Save coordinates before they get modified by put_chess
             display_x, display_y = result.x, result.y
             wine.put_chess(result)
@@ -82,6 +85,9 @@ def computer_vs_computer_demo():
             
             # Second AI's move (White)
             result = wine.get_best_move()
+            if result is None:
+                print("\nThe board is full, the game is a draw.")
+                break
             # Save coordinates before they get modified by put_chess
             display_x, display_y = result.x, result.y
             wine.put_chess(result)
@@ -112,9 +118,12 @@ import sys
 import time
 import os
 from ai import AI, Pos, Pieces, MAX_SIZE
+from profiler import Profiler, profile_from_env
 
 # Initialize AI
 wine = AI()
+if profile_from_env():
+    Profiler(wine)
 
 def clear_screen():
     """Clear the terminal screen"""
@@ -289,11 +298,15 @@ class SimpleUI:
                 wine.timeout_turn = 10000  # 10 seconds per move for stronger play
                 
                 result = wine.get_best_move()
-                wine.put_chess(result)
                 
                 # Restore original timeout
                 wine.timeout_turn = original_timeout
                 
+                if result is None:
+                    print("The board is full, the game is a draw.")
+                    self.is_end = True
+                    continue
+                wine.put_chess(result)
                 self.add_chess(result.x, result.y)
                 print(f"Computer played: {chr(result.x + ord('a'))}{result.y + 1}")
             
@@ -398,14 +411,32 @@ def generate_training_data_menu():
     input("\nPress Enter to return to the main menu...")
     show_welcome()
 
+def play_best(result, ponder):
+    """Report a search, play and print its move, then think on the opponent's time if pondering is on"""
+    wine.report(result)
+    if result.move is None:
+        print("ERROR no move to play, the board is full")
+        return
+    best = Pos(*result.move)
+    print(f"{best.x},{best.y}")
+    wine.put_chess(best)
+    if ponder and not wine.check_win():
+        wine.start_ponder()
+
 def gomocup():
     """Handle Gomocup protocol"""
     print("Gomocup protocol mode. Enter commands:")
+    ponder = False
     while True:
         try:
             command = input().strip()
             command = toupper(command)
             
+            # The search on the opponent's time runs until the next command. Only a TURN
+            # can use it, anything but INFO needs the board back as we left it.
+            if wine.ponder_thread is not None and command not in ("TURN", "INFO"):
+                wine.stop_ponder()
+            
             if command == "START":
                 size = int(input())
                 if size > MAX_SIZE or size <= 5:
@@ -423,9 +454,7 @@ def gomocup():
                 print("OK")
             
             elif command == "BEGIN":
-                best = wine.get_best_move()
-                wine.put_chess(best)
-                print(f"{best.x},{best.y}")
+                play_best(wine.search(), ponder)
             
             elif command == "TURN":
                 pos_input = input().strip()
@@ -441,6 +470,14 @@ def gomocup():
                     print("ERROR")
                     continue
                 
+                if wine.ponder_thread is not None:
+                    p = wine.ponder_move
+                    if p.x == input_x + 4 and p.y == input_y + 4:
+                        # Predicted right, the search goes on with everything it found
+                        play_best(wine.ponder_hit(), ponder)
+                        continue
+                    wine.stop_ponder()
+                
                 input_pos = Pos(input_x, input_y)
                 
                 if (input_pos.x < 0 or input_pos.x >= wine.size or 
@@ -449,9 +486,7 @@ def gomocup():
                     print("ERROR")
                 else:
                     wine.put_chess(input_pos)
-                    best = wine.get_best_move()
-                    wine.put_chess(best)
-                    print(f"{best.x},{best.y}")
+                    play_best(wine.search(), ponder)
             
             elif command == "BOARD":
                 wine.restart()
@@ -485,9 +520,7 @@ def gomocup():
                     command = input().strip()
                     command = toupper(command)
                 
-                best = wine.get_best_move()
-                wine.put_chess(best)
-                print(f"{best.x},{best.y}")
+                play_best(wine.search(), ponder)
             
             elif command == "INFO":
                 key = input().strip()
@@ -508,6 +541,24 @@ def gomocup():
                     if value != 0:
                         wine.time_left = value
                 
+                elif key == "THREAD_NUM":
+                    # Main engine plus THREAD_NUM - 1 Lazy SMP helper processes
+                    value = int(input())
+                    if value > 0:
+                        wine.thread_num = value
+                
+                elif key == "PONDER":
+                    # Not a standard key, pondering is off unless the manager allows it
+                    ponder = int(input()) != 0
+                
+                elif key == "PROFILE":
+                    # Not a standard key either: profile report after every move
+                    on = int(input()) != 0
+                    if on and wine.profiler is None:
+                        Profiler(wine)
+                    elif not on and wine.profiler is not None:
+                        wine.profiler.detach()
+                
                 elif key == "MAX_MEMORY" or key == "GAME_TYPE" or key == "RULE":
                     # These parameters are ignored in the Python version
                     value = int(input())
@@ -0,0 +1,168 @@
+import sys
+import time
+from board import *
+
+PERFT_DEPTH = 2       # Plies walked from every position
+PERFT_POSITIONS = 8   # Benchmark positions walked, see bench.py
+PERFT_VERIFY = 64     # Moves made or taken back between two full state checks
+
+def scan_state(board):
+    """Return a list of differences between the incremental state and one recomputed from the pieces.
+
+    Covers the side to move, the Zobrist key (and the 8 symmetric keys when they
+    are kept), every cell's candidate count, candidate list membership and index,
+    every cell's patterns in all 4 directions, and type_hist and block4_cells.
+    Keys are read from the pieces with Board.get_key(), so a backend with its own
+    get_key() is checked against the Cell layout too.
+    """
+    errors = []
+    cell = board.cell
+    stones = [(x, y, cell[x][y].piece) for x in range(board.b_start, board.b_end)
+              for y in range(board.b_start, board.b_end) if cell[x][y].piece != EMPTY]
+    if len(stones) != board.step:
+        errors.append(f"{len(stones)} stones after {board.step} moves")
+    if board.who != Pieces.BLACK.value ^ (board.step & 1) or board.opp != board.who ^ 1:
+        errors.append("side to move")
+    for i in range(board.step):
+        p = board.rem_move[i]
+        if cell[p.x][p.y].piece != Pieces.BLACK.value ^ (i & 1):
+            errors.append(f"move {i} at ({p.x},{p.y})")
+
+    key = 0
+    sym_keys = [0] * 8
+    for x, y, piece in stones:
+        key ^= board.zobrist[piece][x][y]
+        if board.use_symmetry:
+            sym_keys = [a ^ b for a, b in zip(sym_keys, board.sym_zobrist[piece][pack_pos(x, y)])]
+    if key != board.zobrist_key:
+        errors.append("zobrist key")
+    if board.use_symmetry and sym_keys != board.sym_keys:
+        errors.append("symmetric keys")
+
+    hist = [[0] * NTYPE, [0] * NTYPE]
+    block4 = [0, 0]
+    cands = []
+    for x in range(board.b_start, board.b_end):
+        for y in range(board.b_start, board.b_end):
+            c = cell[x][y]
+            # A cell counts the stones in the 5 x 5 square around it, its own included
+            near = sum(1 for sx, sy, _ in stones if abs(sx - x) <= 2 and abs(sy - y) <= 2)
+            if c.is_cand != near:
+                errors.append(f"is_cand at ({x},{y}) is {c.is_cand}, not {near}")
+            for i in range(4):
+                k = Board.get_key(board, x, y, i)
+                if board.get_key(x, y, i) != k:
+                    errors.append(f"key at ({x},{y}) dir {i}")
+                expected = board.pattern_table[k]
+                if c.pattern[0][i] != expected[0] or c.pattern[1][i] != expected[1]:
+                    errors.append(f"pattern at ({x},{y}) dir {i}")
+            if near and c.piece == EMPTY:
+                v = pack_pos(x, y)
+                cands.append(v)
+                if not 0 <= c.cand_index < len(board.cand_list) or board.cand_list[c.cand_index] != v:
+                    errors.append(f"cand_index at ({x},{y})")
+                for role in range(2):
+                    p = c.pattern[role]
+                    for t in p:
+                        hist[role][t] += 1
+                    if p.count(BLOCK4) >= 2:
+                        block4[role] += 1
+            elif c.cand_index != -1:
+                errors.append(f"cand_index at ({x},{y}) is {c.cand_index}, not -1")
+    if sorted(board.cand_list) != cands:
+        errors.append("candidate list")
+    if hist != board.type_hist or block4 != board.block4_cells:
+        errors.append("type histogram")
+    return errors
+
+class Perft:
+    """Walks every candidate move to a fixed depth, counting and timing make/unmake.
+
+    Positions with a five are leaves. Every verify_every moves made or taken back,
+    the incremental state is compared with scan_state(); the first position that
+    differs stops the walk with its move sequence.
+    """
+    def __init__(self, board, verify_every=PERFT_VERIFY):
+        self.board = board
+        self.verify_every = verify_every
+        self.moves = 0       # make_move() and del_move() calls
+        self.checks = 0
+        self.next_check = verify_every
+        self.errors = []
+        self.check_time = 0.0
+
+    def run(self, depth):
+        """Return the number of leaf positions depth plies below the current one"""
+        b = self.board
+        if depth == 0 or self.errors:
+            return 1
+        nodes = 0
+        for v in list(b.cand_list):
+            b.make_move(b.pos_table[v])
+            self.count()
+            nodes += 1 if b.check_win() else self.run(depth - 1)
+            b.del_move()
+            self.count()
+            if self.errors:
+                break
+        return nodes
+
+    def count(self):
+        self.moves += 1
+        if self.verify_every and self.moves >= self.next_check:
+            self.next_check += self.verify_every
+            self.verify()
+
+    def verify(self):
+        t = time.perf_counter()
+        self.checks += 1
+        errors = scan_state(self.board)
+        if errors:
+            b = self.board
+            line = " ".join(f"[{b.rem_move[i].x - 4},{b.rem_move[i].y - 4}]" for i in range(b.step))
+            self.errors = [f"after {line}: {e}" for e in errors]
+        self.check_time += time.perf_counter() - t
+
+def run_perft(backend="cell", depth=PERFT_DEPTH, count=PERFT_POSITIONS, verify_every=PERFT_VERIFY, symmetry=False):
+    """Walk the benchmark positions, print nodes and make/unmake speed, return True if the state held"""
+    from bench import bench_positions
+    from bitboard import BitBoard
+    board = BitBoard() if backend == "bitboard" else Board()
+    board.set_size(15)
+    board.set_symmetry(symmetry)
+    print(f"{backend} backend, depth {depth}, full check every {verify_every} moves"
+          + (", symmetric keys" if symmetry else ""))
+    print("position      nodes    moves  checks  moves/s")
+    total_moves = 0
+    total_time = 0.0
+    for name, moves in bench_positions(count):
+        board.restart()
+        for x, y in moves:
+            board.make_move(Pos(x + 4, y + 4))
+        perft = Perft(board, verify_every)
+        perft.verify()
+        t = time.perf_counter()
+        nodes = perft.run(depth)
+        # The checks are not part of the speed
+        elapsed = time.perf_counter() - t - perft.check_time
+        if not perft.errors:
+            perft.verify()
+        if perft.errors:
+            for e in perft.errors[:10]:
+                print("mismatch:", e)
+            print(f"{name}: incremental state differs from a full recomputation")
+            return False
+        total_moves += perft.moves
+        total_time += elapsed
+        print(f"{name:10s}  {nodes:7d}  {perft.moves:7d}  {perft.checks:6d}  {perft.moves / elapsed:7.0f}")
+    print(f"total: {total_moves} moves, {total_moves / total_time:.0f} make/unmake per second: OK")
+    return True
+
+if __name__ == "__main__":
+    # Optional depth and check interval, e.g. "python perft.py 3 1000"; 0 never checks
+    # during the walk. Add "bitboard" for the bitboard backend, "symmetry" for the 8 keys.
+    args = [a for a in sys.argv[1:] if a.isdigit()]
+    depth = int(args[0]) if args else PERFT_DEPTH
+    verify_every = int(args[1]) if len(args) > 1 else PERFT_VERIFY
+    backend = "bitboard" if "bitboard" in sys.argv else "cell"
+    sys.exit(0 if run_perft(backend, depth, verify_every=verify_every, symmetry="symmetry" in sys.argv) else 1)
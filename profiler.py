@@ -0,0 +1,112 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILE_ENV = "WINE_PROFILE"  # Set to a non-zero value to profile from the start
+# Engine methods timed by the profiler, nested ones count in their callers' time too
+PROFILE_FUNCS = ("make_move", "del_move", "update_type", "get_key", "generate_move", "sort",
+                 "evaluate", "evaluate_move")
+SAMPLE_INTERVAL = 0.001  # Seconds between two wall-time samples of the search thread
+SAMPLE_TOP = 8           # Functions listed in the sample report
+
+def profile_from_env():
+    return os.environ.get(PROFILE_ENV, "0") not in ("", "0")
+
+class Profiler:
+    """Call counts and cumulative time of the engine's hot functions, plus wall-time samples.
+
+    Attaching replaces the PROFILE_FUNCS of one engine with timing wrappers on the
+    instance and wraps main_search() to run a sampling thread, which records the
+    innermost function of the searching thread every SAMPLE_INTERVAL. The samples
+    are not slowed down by the wrappers' own overhead the way the timings are.
+    detach() removes everything, so without a profiler the engine runs the plain
+    class methods. After every search the report is printed as MESSAGE lines by
+    AI.report().
+    """
+    def __init__(self, engine=None):
+        self.engine = None
+        self.counts = Counter()
+        self.times = Counter()
+        self.samples = Counter()
+        self.elapsed = 0.0
+        self.wrapper_code = None
+        if engine is not None:
+            self.attach(engine)
+
+    def attach(self, engine):
+        self.engine = engine
+        engine.profiler = self
+        # Wrap whatever the engine runs now, e.g. a stats.SearchStats hook, and put it back on detach
+        self.saved = {name: engine.__dict__.get(name) for name in PROFILE_FUNCS + ("main_search",)}
+        for name in PROFILE_FUNCS:
+            setattr(engine, name, self.timed(getattr(engine, name), name))
+        search = engine.main_search
+        def main_search():
+            return self.sampled(search)
+        engine.main_search = main_search
+
+    def detach(self):
+        e = self.engine
+        for name, method in self.saved.items():
+            if method is None:
+                e.__dict__.pop(name, None)
+            else:
+                setattr(e, name, method)
+        e.profiler = None
+        self.engine = None
+
+    def timed(self, method, name):
+        counts, times = self.counts, self.times
+        clock = time.perf_counter
+
+        def wrapper(*args):
+            t = clock()
+            try:
+                return method(*args)
+            finally:
+                times[name] += clock() - t
+                counts[name] += 1
+        self.wrapper_code = wrapper.__code__
+        return wrapper
+
+    def sampled(self, search):
+        # Run one search with a fresh profile and a sampler following this thread
+        self.counts.clear()
+        self.times.clear()
+        self.samples.clear()
+        target = threading.get_ident()
+        done = threading.Event()
+        sampler = threading.Thread(target=self.sample, args=(target, done), daemon=True)
+        sampler.start()
+        t = time.perf_counter()
+        try:
+            return search()
+        finally:
+            self.elapsed = time.perf_counter() - t
+            done.set()
+            sampler.join()
+
+    def sample(self, target, done):
+        while not done.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(target)
+            if frame is not None:
+                code = frame.f_code
+                if code is self.wrapper_code:
+                    self.samples["(profiler overhead)"] += 1
+                else:
+                    self.samples[getattr(code, "co_qualname", code.co_name)] += 1
+
+    def report_lines(self):
+        """Flat report of the last search, slowest first"""
+        total = max(self.elapsed, 1e-9)
+        lines = [f"profile {self.elapsed * 1000:.0f} ms: function calls total_ms us/call share"]
+        for name in sorted(self.times, key=self.times.get, reverse=True):
+            t, n = self.times[name], self.counts[name]
+            lines.append(f"profile {name} {n} {t * 1000:.0f} {t * 1e6 / n:.1f} {t * 100 / total:.0f}%")
+        n = sum(self.samples.values())
+        if n:
+            lines.append(f"profile {n} samples:" + "".join(
+                f" {name} {count * 100 / n:.0f}%" for name, count in self.samples.most_common(SAMPLE_TOP)))
+        return lines
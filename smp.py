@@ -0,0 +1,189 @@
+import atexit
+import json
+import multiprocessing as mp
+import os
+import sys
+from array import array
+from multiprocessing import shared_memory
+from board import *
+
+# Transposition tables placed in shared memory as (attribute, typecode, items),
+# 8-byte items first so every table stays aligned
+SHARED_TABLES = [("hash_key", 'Q', HASH_SIZE), ("hash_data", 'Q', HASH_SIZE)]
+# Search settings of the main engine that helpers copy with every job, as AI attributes
+HELPER_CONFIG = ("min_depth", "depth_step", "max_moves", "use_lmr", "use_extensions", "use_aspiration",
+                 "use_killers", "use_history", "vcf_leaf", "multi_pv", "eval", "limits")
+
+def shared_size():
+    return sum(n * array(code).itemsize for _, code, n in SHARED_TABLES)
+
+def attach_tables(board, buf):
+    # Point the transposition tables of a board at a shared buffer, in place of its arrays
+    off = 0
+    for name, code, n in SHARED_TABLES:
+        size = n * array(code).itemsize
+        setattr(board, name, buf[off:off + size].cast(code))
+        off += size
+
+def helper_loop(conn, shm_name, engine_cls, index, stop):
+    """Body of a helper process: search every position it is sent until it gets None"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    engine = engine_cls()  # Zobrist keys come from a fixed seed, so they match the main engine's
+    attach_tables(engine, shm.buf)
+    engine.helper_id = index
+    engine.stop_flag = stop
+    # Root moves losing to a VCT are marked by the main engine, which filters our result
+    engine.vct_defend = False
+
+    while True:
+        job = conn.recv()
+        if job is None:
+            break
+        size, moves, budget, engine.generation, symmetry, config = job
+        for attr, value in config.items():
+            setattr(engine, attr, value)
+        while engine.step:
+            engine.del_move()
+        if engine.b_end != size + 4:
+            engine.set_size(size)
+        if engine.use_symmetry != symmetry:
+            engine.set_symmetry(symmetry)
+        for v in moves:
+            engine.make_move(engine.pos_table[v])
+        engine.ply = 0
+        engine.start = engine.timeman.start_fixed(budget)
+        engine.total = 0
+        engine.next_poll = 0
+        engine.clear_ordering()
+
+        # Odd helpers search the odd depths in between the main engine's
+        engine.deepen(engine.min_depth + (index & 1))
+        best = engine.best_point
+        line = [pack_pos(engine.best_line.moves[i].x, engine.best_line.moves[i].y)
+                for i in range(engine.best_line.n)]
+        conn.send((engine.completed_depth, pack_pos(best.p.x, best.p.y) if best.p.x != -1 else 0,
+                   best.val, line, engine.total))
+
+    # Drop the views into the block before closing it
+    for name, _, _ in SHARED_TABLES:
+        setattr(engine, name, None)
+    shm.close()
+
+class LazySMP:
+    """Lazy SMP helper processes for one engine.
+
+    Helpers run the engine's own iterative deepening on the same position at staggered
+    depths, sharing its transposition table through one shared memory block.
+    Table entries are written without locks, AI.probe_hash() rejects torn ones. The
+    engine keeps the shared tables until close(), the pool only ever grows.
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        self.shm = shared_memory.SharedMemory(create=True, size=shared_size())
+        attach_tables(engine, self.shm.buf)  # A new block is zero filled, i.e. empty
+        self.ctx = mp.get_context()
+        self.stop = self.ctx.RawValue('b', 0)
+        self.helpers = []  # (process, connection) pairs
+        self.active = 0
+        atexit.register(self.close)  # Also unlinks the block
+
+    def resize(self, n):
+        while len(self.helpers) < n:
+            conn, child = self.ctx.Pipe()
+            proc = self.ctx.Process(target=helper_loop, daemon=True,
+                                    args=(child, self.shm.name, type(self.engine), len(self.helpers) + 1,
+                                          self.stop))
+            proc.start()
+            self.helpers.append((proc, conn))
+
+    def start(self, n, budget):
+        """Send the engine's position and search settings to n helpers with a time budget in milliseconds"""
+        e = self.engine
+        self.resize(n)
+        self.stop.value = 0
+        job = (e.size, [pack_pos(e.rem_move[i].x, e.rem_move[i].y) for i in range(e.step)], budget,
+               e.generation, e.use_symmetry, {attr: getattr(e, attr) for attr in HELPER_CONFIG})
+        for _, conn in self.helpers[:n]:
+            conn.send(job)
+        self.active = n
+
+    def finish(self):
+        """Stop the running helpers, return their (depth, move, val, line, nodes) results"""
+        self.stop.value = 1
+        results = [conn.recv() for _, conn in self.helpers[:self.active]]
+        self.active = 0
+        return results
+
+    def close(self):
+        """Stop the helpers and free the shared block, the engine gets private copies of its tables"""
+        if self.shm is None:
+            return
+        atexit.unregister(self.close)
+        for proc, conn in self.helpers:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+        for proc, _ in self.helpers:
+            proc.join(1)
+        self.helpers = []
+        # The engine's views into the block have to go before it can be closed
+        e = self.engine
+        for name, code, _ in SHARED_TABLES:
+            table = array(code)
+            table.frombytes(getattr(e, name).cast('B'))
+            setattr(e, name, table)
+        if e.smp is self:
+            e.smp = None
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+
+def scaling_benchmark(threads=(1, 2, 4, 8), game_dir="data2", num_positions=8, move_time=3000, size=15):
+    """Search corpus positions with a fixed move time at each thread count"""
+    from ai import BitBoardAI
+    engine = BitBoardAI()
+    engine.set_size(size)
+    engine.timeout_turn = move_time
+
+    # Early middle game positions that need a real search: several moves, no win by fours
+    positions = []
+    game_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), game_dir)
+    for name in sorted(f for f in os.listdir(game_dir) if f.startswith("game_")):
+        with open(os.path.join(game_dir, name)) as f:
+            game = json.load(f)
+        if len(game) < 12:
+            continue
+        moves = [game[0]["board_state"][0]] + [e["next_move"] for e in game]
+        moves = [abs(m) for m in moves[:len(moves) // 3]]
+        engine.restart()
+        for m in moves:
+            engine.put_chess(Pos(m % size, m // size))
+        if engine.generate_move(engine.root_moves) > 1 and engine.vcf.search() is None:
+            positions.append(moves)
+            if len(positions) >= num_positions:
+                break
+    if not positions:
+        raise ValueError(f"No positions in {game_dir}")
+
+    print(f"{len(positions)} positions, {move_time} ms per move, {os.cpu_count()} CPUs")
+    print("threads  completed depth  nodes/s")
+    for n in threads:
+        engine.thread_num = n
+        depth = nodes = elapsed = 0
+        for moves in positions:
+            engine.restart()
+            for m in moves:
+                engine.put_chess(Pos(m % size, m // size))
+            engine.main_search()
+            depth += engine.completed_depth
+            nodes += engine.total
+            elapsed += engine.think_time
+        print(f"{n:7d}  {depth / len(positions):15.2f}  {nodes * 1000 / max(elapsed, 1):7.0f}")
+
+if __name__ == "__main__":
+    # Optional comma separated thread counts, e.g. "python smp.py 1,2,4"
+    if len(sys.argv) > 1:
+        scaling_benchmark(tuple(int(v) for v in sys.argv[1].split(",")))
+    else:
+        scaling_benchmark()
@@ -0,0 +1,146 @@
+import json
+import sys
+import time
+from board import *
+
+# Wrapped engine methods, replaced on the instance while a collector is attached
+HOOKS = ("main_search", "evaluate", "record_cutoff", "cut_move_list")
+
+class SearchStats:
+    """Opt-in statistics of an engine's searches, exportable as JSON.
+
+    Attaching wraps a few engine methods on the instance and registers an info
+    callback, detaching removes them again, so an engine without a collector runs
+    the plain class methods and pays nothing. One record is kept per search:
+    totals, transposition table rates, a histogram of the search order index of
+    the move causing each beta cutoff, how much cut_move_list() pruned, the
+    number of evaluations, and nodes, time and effective branching factor of
+    every completed iteration.
+    """
+    def __init__(self, engine=None):
+        self.engine = None
+        self.searches = []
+        self.current = None
+        if engine is not None:
+            self.attach(engine)
+
+    def attach(self, engine):
+        self.engine = engine
+        engine.stats = self
+        for name in HOOKS:
+            setattr(engine, name, getattr(SearchStats, name).__get__(engine))
+        engine.info_callbacks.append(self.iteration)
+
+    def detach(self):
+        e = self.engine
+        for name in HOOKS:
+            e.__dict__.pop(name, None)
+        e.info_callbacks.remove(self.iteration)
+        e.stats = None
+        self.engine = None
+
+    # The wrappers below are bound to the engine, the collector is reached as e.stats.
+    # Searches not started by main_search() (helpers, harnesses) are not recorded.
+
+    def main_search(e):
+        s = e.stats
+        s.current = {
+            "step": e.step, "iterations": [], "cutoff_index": [0] * (e.max_moves + 2),
+            "evaluations": 0, "move_lists": 0, "candidates": 0, "kept": 0, "pruned_lists": 0,
+        }
+        t = time.perf_counter()
+        best = type(e).main_search(e)
+        record = s.current
+        record.update({
+            "move": [best.x - 4, best.y - 4] if best.x != -1 else None,
+            "score": e.best_point.val,
+            "depth": e.search_depth,
+            "completed_depth": e.completed_depth,
+            "nodes": e.total,
+            "time_ms": (time.perf_counter() - t) * 1000,
+            "re_searches": e.re_searches,
+            "hash_probes": e.hash_probes,
+            "hash_hits": e.hash_hits,
+            "hash_cutoffs": e.hash_count,
+            "hash_hit_rate": e.hash_hits / e.hash_probes if e.hash_probes else 0.0,
+            "hash_cutoff_rate": e.hash_count / e.hash_probes if e.hash_probes else 0.0,
+            "cutoffs": e.cut_count,
+            "first_move_cutoff_rate": e.first_cut_count / e.cut_count if e.cut_count else 0.0,
+            "kept_ratio": record["kept"] / record["candidates"] if record["candidates"] else 0.0,
+        })
+        # Trailing zeros of the histogram carry nothing
+        hist = record["cutoff_index"]
+        while hist and hist[-1] == 0:
+            hist.pop()
+        s.searches.append(record)
+        s.current = None
+        return best
+
+    def evaluate(e):
+        if e.stats.current is not None:
+            e.stats.current["evaluations"] += 1
+        return type(e).evaluate(e)
+
+    def record_cutoff(e, p, depth, index):
+        if e.stats.current is not None:
+            e.stats.current["cutoff_index"][min(index, e.max_moves + 1)] += 1
+        type(e).record_cutoff(e, p, depth, index)
+
+    def cut_move_list(e, move, cand, cand_count):
+        n = type(e).cut_move_list(e, move, cand, cand_count)
+        record = e.stats.current
+        if record is not None:
+            record["move_lists"] += 1
+            record["candidates"] += cand_count
+            # 0 means no threat rule applied and the best max_moves are taken
+            record["kept"] += n if n else min(cand_count, e.max_moves)
+            record["pruned_lists"] += n > 0
+        return n
+
+    def iteration(self, result):
+        """Info callback: one completed iteration"""
+        record = self.current
+        if record is None:
+            return
+        iterations = record["iterations"]
+        prev = iterations[-1] if iterations else None
+        nodes = result.nodes - (prev["total_nodes"] if prev else 0)
+        iterations.append({
+            "depth": result.depth,
+            "score": result.score,
+            "move": list(result.move) if result.move is not None else None,
+            "nodes": nodes,
+            "total_nodes": result.nodes,
+            "time_ms": result.time - (prev["total_time_ms"] if prev else 0),
+            "total_time_ms": result.time,
+            "ebf": (nodes / prev["nodes"]) ** (1 / max(1, result.depth - prev["depth"]))
+                   if prev and prev["nodes"] else None,
+            "hash_hit_rate": result.hash_hits / result.hash_probes if result.hash_probes else 0.0,
+        })
+
+    def to_json(self, **kwargs):
+        return json.dumps({"searches": self.searches}, **kwargs)
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            f.write(self.to_json(indent=1))
+
+def collect(game_dir="data2", num_games=3, plies=12, move_time=2000, size=15):
+    """Search a few corpus positions with a collector attached and print the JSON"""
+    from ai import BitBoardAI
+    from book import corpus_games
+    engine = BitBoardAI()
+    engine.set_size(size)
+    engine.timeout_turn = move_time
+    engine.use_book = False
+    stats = SearchStats(engine)
+    for moves in list(corpus_games((game_dir,)))[:num_games]:
+        engine.restart()
+        for x, y in moves[:plies]:
+            engine.put_chess(Pos(x, y))
+        engine.search()
+    stats.detach()
+    print(stats.to_json(indent=1))
+
+if __name__ == "__main__":
+    collect(*sys.argv[1:2])
@@ -0,0 +1,278 @@
+import json
+import multiprocessing
+import os
+import sys
+import time
+from board import *
+from book import corpus_games
+
+TACTICS_PLIES = 7        # Positions this many plies before the winning five, winner to move
+TACTICS_SOLVE_MS = 3000  # VCT budget for proving a position is won
+TACTICS_MOVE_MS = 2000   # Search time per position
+
+# Tactical suite, bump SUITE_VERSION whenever its positions change
+SUITE_VERSION = 2
+SUITE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tactics_suite.json")
+# One JSON line appended per suite run
+SUITE_RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tactics_results.jsonl")
+SUITE_DIRS = ("gomoku_data", "data2")    # Decided games the suite is mined from
+SUITE_WIN_PLIES = (5, 7, 9)              # Win in 3, 4 and 5 moves
+SUITE_DEFEND_PLIES = (4, 6, 8)           # Loser to move this many plies before the five
+SUITE_DEFEND_NODES = 10000               # VCT budget for a reply counting as a defence
+SUITE_MAX_DEFENCES = 4                   # More safe replies than this is no must-defend position
+
+# Settings of the regression check searches, which leave the wins to the main search
+SOLVERS_OFF = dict(vcf_attack=False, vct_attack=False, vct_defend=False, vcf_leaf=False, use_book=False)
+# Search settings compared by the regression check, as AI attributes
+CONFIGS = [
+    ("plain", dict(use_lmr=False, use_extensions=False)),
+    ("lmr", dict(use_lmr=True, use_extensions=False)),
+    ("extensions", dict(use_lmr=False, use_extensions=True)),
+    ("default", dict(use_lmr=True, use_extensions=True)),
+]
+
+def decided_games(dirs=None):
+    # Move lists of the corpus games that end in a five
+    from bitboard import BitBoard
+    board = BitBoard()
+    board.set_size(15)
+    for moves in corpus_games() if dirs is None else corpus_games(dirs):
+        board.restart()
+        for x, y in moves:
+            board.make_move(Pos(x + 4, y + 4))
+        if board.check_win():
+            yield moves
+
+def winning_positions(count=30, plies=TACTICS_PLIES, size=15, dirs=None):
+    """Return move lists of corpus positions the side to move wins by force.
+
+    The positions come from the end of decided games and are kept when the VCT
+    solver proves the win and the VCF solver finds none, so the winning line is a few moves deep but short
+    enough for the main search to see.
+    """
+    from ai import BitBoardAI
+    engine = BitBoardAI()
+    engine.set_size(size)
+    positions = []
+    for moves in decided_games(dirs):
+        if len(moves) < plies + 6:
+            continue
+        engine.restart()
+        for x, y in moves[:len(moves) - plies]:
+            engine.make_move(Pos(x + 4, y + 4))
+        # A VCF win is found by main_search() before it searches, so it tells nothing about the search
+        if engine.vcf.search() is None and engine.vct.search(TACTICS_SOLVE_MS) is not None:
+            positions.append(moves[:len(moves) - plies])
+            if len(positions) >= count:
+                break
+    return positions
+
+def defending_positions(count=30, plies=SUITE_DEFEND_PLIES[0], size=15, dirs=None):
+    """Return (moves, defences) of corpus positions with only a few replies that hold.
+
+    The loser of a decided game is to move, without a win of its own. A reply is
+    a defence when the VCT solver finds no win for the opponent after it within
+    SUITE_DEFEND_NODES nodes; positions with 1 to SUITE_MAX_DEFENCES of them are kept.
+    """
+    from ai import BitBoardAI
+    engine = BitBoardAI()
+    engine.set_size(size)
+    positions = []
+    for moves in decided_games(dirs):
+        if len(moves) < plies + 6:
+            continue
+        engine.restart()
+        engine.vct.clear()
+        for x, y in moves[:len(moves) - plies]:
+            engine.make_move(Pos(x + 4, y + 4))
+        if engine.vcf.search() is not None or engine.vct.search(float("inf"), max_nodes=SUITE_DEFEND_NODES):
+            continue
+        defences = []
+        for v in list(engine.cand_list):
+            engine.make_move(engine.pos_table[v])
+            if not engine.check_win() and engine.vct.search(float("inf"), max_nodes=SUITE_DEFEND_NODES) is None:
+                defences.append([(v >> 5) - 4, (v & 31) - 4])
+            engine.del_move()
+            if len(defences) > SUITE_MAX_DEFENCES:
+                break
+        if 1 <= len(defences) <= SUITE_MAX_DEFENCES:
+            positions.append((moves[:len(moves) - plies], sorted(defences)))
+            if len(positions) >= count:
+                break
+    return positions
+
+def mine_suite(count=30, path=SUITE_FILE, dirs=SUITE_DIRS):
+    """Write a suite of count won and count must-defend positions, spread over their plies"""
+    suite = []
+    seen = set()
+    def add(kind, plies, moves, solutions):
+        key = tuple(map(tuple, moves))
+        if key not in seen:
+            seen.add(key)
+            number = sum(p["kind"] == kind for p in suite)
+            suite.append({"id": f"{kind}{number:02d}", "kind": kind, "plies": plies,
+                          "moves": [list(m) for m in moves], "solutions": solutions})
+    for plies in SUITE_WIN_PLIES:
+        for moves in winning_positions(count // len(SUITE_WIN_PLIES), plies, dirs=dirs):
+            add("win", plies, moves, [])
+    for plies in SUITE_DEFEND_PLIES:
+        for moves, defences in defending_positions(count // len(SUITE_DEFEND_PLIES), plies, dirs=dirs):
+            add("defend", plies, moves, defences)
+    if not suite:
+        raise ValueError(f"No suite positions in {', '.join(dirs)}")
+    # One position per line, so changes to the suite read well in a diff
+    with open(path, "w") as f:
+        f.write(f'{{"version": {SUITE_VERSION}, "sources": {json.dumps(list(dirs))}, "positions": [\n')
+        f.write(",\n".join(json.dumps(p) for p in suite))
+        f.write("\n]}\n")
+    print(f"Wrote {len(suite)} positions to {path}")
+    return suite
+
+def load_suite(path=SUITE_FILE):
+    with open(path) as f:
+        suite = json.load(f)
+    if suite.get("version") != SUITE_VERSION:
+        raise ValueError(f"{path} is suite version {suite.get('version')}, not {SUITE_VERSION}")
+    return suite["positions"]
+
+def passes(position, move, score):
+    # A won position is solved when the search knows it wins, a defence by playing one
+    if position["kind"] == "win":
+        return score >= 10000
+    return move is not None and list(move) in position["solutions"]
+
+_engine = None  # Engine of a suite worker process
+
+def suite_worker(args):
+    """Search one suite position within move_time, return its record"""
+    global _engine
+    from ai import BitBoardAI, SearchLimits
+    from bench import set_position
+    position, move_time = args
+    if _engine is None:
+        _engine = BitBoardAI()
+        _engine.set_size(15)
+        _engine.use_book = False
+    engine = _engine
+    set_position(engine, position["moves"])
+    # Every completed iteration, the solution is found at the first one from which all pass
+    iterations = []
+    def iteration(result):
+        iterations.append((result.time, result.nodes, passes(position, result.move, result.score)))
+    engine.info_callbacks.append(iteration)
+    result = engine.search(SearchLimits(time=move_time))
+    engine.info_callbacks.remove(iteration)
+    iterations.append((result.time, result.nodes, passes(position, result.move, result.score)))
+    found = None
+    for t, nodes, ok in reversed(iterations):
+        if not ok:
+            break
+        found = (t, nodes)
+    return {
+        "id": position["id"],
+        "kind": position["kind"],
+        "solved": found is not None,
+        "time_ms": round(found[0], 1) if found else None,
+        "nodes": found[1] if found else None,
+        "move": list(result.move) if result.move is not None else None,
+        "score": round(result.score, 1),
+        "depth": result.depth,
+        "total_nodes": result.nodes,
+    }
+
+def run_suite(move_time=TACTICS_MOVE_MS, processes=None, path=SUITE_FILE, results=SUITE_RESULTS):
+    """Run the suite over worker processes, print the outcome and append it to results as one JSON line.
+
+    Time and nodes to solution are those of the first iteration from which the
+    chosen move passes to the end of the search, or of the whole search when a
+    solver answered. With more processes than CPUs the searches get less time.
+    """
+    positions = load_suite(path)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    print(f"{len(positions)} positions, {move_time} ms each, {processes} processes")
+    t = time.time()
+    with multiprocessing.Pool(processes=processes) as pool:
+        records = pool.map(suite_worker, [(p, move_time) for p in positions])
+    elapsed = time.time() - t
+    print("id         solved   time_ms    nodes  move      score")
+    for r in records:
+        move = "none" if r["move"] is None else f"[{r['move'][0]},{r['move'][1]}]"
+        time_ms = f"{r['time_ms']:.0f}" if r["solved"] else "-"
+        nodes = str(r["nodes"]) if r["solved"] else "-"
+        print(f"{r['id']:9s}  {'yes' if r['solved'] else 'no':6s}  {time_ms:>8s}  {nodes:>7s}  {move:8s}  {r['score']:>6}")
+    summary = {}
+    for kind in ("win", "defend", "all"):
+        group = [r for r in records if kind == "all" or r["kind"] == kind]
+        done = [r for r in group if r["solved"]]
+        summary[kind] = {
+            "positions": len(group),
+            "solved": len(done),
+            "pass_rate": round(len(done) / len(group), 4) if group else 0.0,
+            "avg_time_ms": round(sum(r["time_ms"] for r in done) / len(done), 1) if done else None,
+            "avg_nodes": round(sum(r["nodes"] for r in done) / len(done)) if done else None,
+        }
+        s = summary[kind]
+        print(f"{kind}: {s['solved']}/{s['positions']} solved, "
+              f"avg {s['avg_time_ms']} ms and {s['avg_nodes']} nodes to solution")
+    run = {"date": time.strftime("%Y-%m-%d %H:%M:%S"), "suite_version": SUITE_VERSION,
+           "move_time": move_time, "processes": processes, "elapsed_s": round(elapsed, 1),
+           "summary": summary, "positions": records}
+    if results:
+        with open(results, "a") as f:
+            f.write(json.dumps(run) + "\n")
+    return run
+
+def solve(engine, moves, move_time=TACTICS_MOVE_MS):
+    """Search a position for move_time ms with the settings of SOLVERS_OFF, return the SearchResult"""
+    from ai import SearchLimits
+    from bench import set_position
+    set_position(engine, moves)
+    saved = {attr: getattr(engine, attr) for attr in SOLVERS_OFF}
+    for attr, value in SOLVERS_OFF.items():
+        setattr(engine, attr, value)
+    try:
+        return engine.search(SearchLimits(time=move_time))
+    finally:
+        for attr, value in saved.items():
+            setattr(engine, attr, value)
+
+def check_reductions(positions, move_time=TACTICS_MOVE_MS):
+    """Solve the positions with each of CONFIGS at equal time, True if the default holds up"""
+    if not positions:
+        raise ValueError("No won positions to solve")
+    from ai import BitBoardAI
+    engine = BitBoardAI()
+    engine.set_size(15)
+    print(f"{len(positions)} won positions, {move_time} ms each")
+    print("config      solved  avg depth  nodes/s")
+    solved = {}
+    for name, config in CONFIGS:
+        for attr, value in config.items():
+            setattr(engine, attr, value)
+        count = depth = nodes = 0
+        t = time.time()
+        for moves in positions:
+            result = solve(engine, moves, move_time)
+            count += result.score >= 10000
+            depth += result.depth
+            nodes += result.nodes
+        solved[name] = count
+        print(f"{name:10s}  {count:6d}  {depth / len(positions):9.2f}  {nodes / (time.time() - t):7.0f}")
+    ok = solved["default"] >= solved["plain"]
+    print("OK" if ok else "Tactical regression")
+    return ok
+
+if __name__ == "__main__":
+    # "python tactics.py suite [move_time] [processes]" runs the suite, "python tactics.py mine [count]"
+    # rebuilds it; otherwise an optional move time in ms and number of positions for the
+    # reduction check, e.g. "python tactics.py 1000 20"
+    args = sys.argv[1:]
+    if args and args[0] == "suite":
+        run_suite(int(args[1]) if len(args) > 1 else TACTICS_MOVE_MS, int(args[2]) if len(args) > 2 else None)
+    elif args and args[0] == "mine":
+        mine_suite(int(args[1]) if len(args) > 1 else 30)
+    else:
+        move_time = int(args[0]) if args else TACTICS_MOVE_MS
+        count = int(args[1]) if len(args) > 1 else 30
+        sys.exit(0 if check_reductions(winning_positions(count), move_time) else 1)
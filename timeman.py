@@ -0,0 +1,189 @@
+import random
+import sys
+import time
+
+MOVE_OVERHEAD = 50      # Milliseconds kept back on every move for I/O and process latency
+EXPECTED_PLIES = 60     # Typical game length, sets how many of our moves the clock must cover
+MIN_MOVES_TO_GO = 16    # Moves still budgeted for however long the game already is
+MAX_SHARE = 0.2         # Largest share of the remaining clock one move may use
+MAX_RATIO = 4           # Hard limit as a multiple of the planned time
+INSTABILITY_SCALE = 0.5 # Extra planned time per recent change of the best move
+SCORE_DROP = 150        # Score fall between iterations that asks for more time
+DROP_SCALE = 1.5
+NEXT_ITER_SHARE = 0.6   # Share of the target after which no new iteration is started
+OVERRUN = 1.5           # How far past the target the next iteration is predicted to end at most
+DEFAULT_EBF = 4.0       # Guessed time ratio of consecutive iterations until measured
+POLL_MS = 10            # Wanted time between two clock checks in the search
+POLL_MIN = 16
+POLL_MAX = 4096
+
+class TimeManager:
+    """Time budget of one move.
+
+    start() turns the Gomocup limits into a planned time (optimum) and a hard limit
+    (maximum), both in milliseconds. The clock is the remaining match time spread
+    over the moves we still expect to play, capped by timeout_turn. After every
+    iteration, iteration_done() says whether to search deeper. A best move that keeps
+    changing or a falling score stretches the plan towards the hard limit, a won or
+    lost position stops at once, and an iteration predicted not to finish in time is
+    not started. The clock is any function returning seconds, see SimClock.
+    """
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.start_time = clock()
+        self.optimum = 0
+        self.maximum = 0
+        self.last_best = None
+        self.last_val = 0
+        self.instability = 0.0
+        self.iter_start = 0
+        self.iter_time = 0
+        self.ebf = DEFAULT_EBF
+
+    def start(self, timeout_turn, timeout_match, time_left, step):
+        """Plan the move about to be searched, step is the number of stones on the board"""
+        self.plan(timeout_turn, timeout_match, time_left, step)
+        return self.restart()
+
+    def start_fixed(self, ms):
+        """Give the move about to be searched exactly ms milliseconds, for helpers and tests"""
+        self.optimum = self.maximum = ms
+        return self.restart()
+
+    def restart(self):
+        self.start_time = self.clock()
+        self.last_best = None
+        self.last_val = 0
+        self.instability = 0.0
+        self.iter_start = 0
+        self.iter_time = 0
+        self.ebf = DEFAULT_EBF
+        return self.start_time
+
+    def ponderhit(self, timeout_turn, timeout_match, time_left, step):
+        """The pondered move was played: plan from now on, keeping what the iterations measured"""
+        shift = self.elapsed()
+        self.start_time = self.clock()
+        self.plan(timeout_turn, timeout_match, time_left, step)
+        self.iter_start -= shift
+        return self.start_time
+
+    def plan(self, timeout_turn, timeout_match, time_left, step):
+        moves_to_go = max(MIN_MOVES_TO_GO, (EXPECTED_PLIES - step) // 2)
+        # The overhead of every move still to come is kept out of the search budget
+        left = max(0, min(time_left, timeout_match) - MOVE_OVERHEAD * moves_to_go)
+        turn = max(0, timeout_turn - MOVE_OVERHEAD)
+        optimum = min(turn, left / moves_to_go)
+        self.maximum = min(turn, left * MAX_SHARE, optimum * MAX_RATIO)
+        self.optimum = min(optimum, self.maximum)
+
+    def elapsed(self):
+        """Milliseconds since start()"""
+        return (self.clock() - self.start_time) * 1000
+
+    def time_up(self):
+        return self.elapsed() >= self.maximum
+
+    def iteration_done(self, best, val):
+        """Record a finished iteration, return True if the search should stop"""
+        now = self.elapsed()
+        iter_time = now - self.iter_start
+        if self.iter_time > 0 and iter_time > 0:
+            self.ebf = min(8.0, max(2.0, iter_time / self.iter_time))
+        self.iter_start = now
+        self.iter_time = iter_time
+
+        # A win or loss is settled, searching deeper cannot change it
+        if val >= 10000 or val <= -10000:
+            return True
+
+        self.instability *= 0.5
+        if self.last_best is not None and best is not self.last_best:
+            self.instability += 1
+        scale = 1 + INSTABILITY_SCALE * self.instability
+        if self.last_best is not None and val < self.last_val - SCORE_DROP:
+            scale *= DROP_SCALE
+        self.last_best = best
+        self.last_val = val
+
+        # The next iteration takes longer than all before it, only start it if it is
+        # likely to end near the target and surely before the hard limit
+        target = min(self.optimum * scale, self.maximum)
+        finish = now + iter_time * self.ebf
+        return now >= target * NEXT_ITER_SHARE or finish > min(target * OVERRUN, self.maximum)
+
+    def poll_interval(self, nodes):
+        """Nodes to search before the next clock check, from the speed measured so far"""
+        now = self.elapsed()
+        if now <= 0:
+            return POLL_MIN
+        return int(min(POLL_MAX, max(POLL_MIN, nodes / now * POLL_MS)))
+
+class SimClock:
+    """Clock that only moves when told to, for running the time manager without searching"""
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, ms):
+        self.now += ms / 1000
+
+def simulate_game(plies, timeout_turn=30000, timeout_match=180000, seed=0, first_iter=20, ebf=5.0,
+                  latency=20):
+    """Play our side of a game of the given length against a simulated search.
+
+    Every iteration costs first_iter * ebf^k ms with some noise, the best move and
+    score wander at random, and the manager decides when to stop. Returns the time
+    left before each of our moves, a negative value is a loss on time.
+    """
+    rng = random.Random(seed)
+    clock = SimClock()
+    tm = TimeManager(clock)
+    time_left = timeout_match
+    history = []
+    for step in range(0, plies, 2):
+        history.append(time_left)
+        tm.start(timeout_turn, timeout_match, time_left, step)
+        best, val, cost = 0, 0.0, first_iter
+        while True:
+            cost *= rng.uniform(0.7, 1.3)
+            # The search polls the clock and aborts the iteration at the hard limit
+            if tm.elapsed() + cost >= tm.maximum:
+                clock.advance(max(0, tm.maximum - tm.elapsed()))
+                break
+            clock.advance(cost)
+            if rng.random() < 0.3:
+                best = rng.randrange(10)
+            val += rng.gauss(0, 100)
+            if tm.iteration_done(best, val):
+                break
+            cost *= ebf
+        time_left -= tm.elapsed() + latency
+        if time_left < 0:
+            break
+    history.append(time_left)
+    return history
+
+def simulate_matches(seeds=20):
+    """Check that no game length runs out of clock, and show how the time is spread"""
+    ok = True
+    print("plies  match ms  turn ms  min left  first 10 moves  last 10 moves")
+    for timeout_match, timeout_turn in ((180000, 30000), (60000, 10000), (15000, 5000)):
+        for plies in (30, 60, 100, 150):
+            lowest = timeout_match
+            early = late = 0.0
+            for seed in range(seeds):
+                h = simulate_game(plies, timeout_turn, timeout_match, seed)
+                lowest = min(lowest, h[-1])
+                used = [a - b for a, b in zip(h, h[1:])]
+                early += sum(used[:10]) / seeds
+                late += sum(used[-10:]) / seeds
+            ok = ok and lowest >= 0
+            print(f"{plies:5d}  {timeout_match:8d}  {timeout_turn:7d}  {lowest:8.0f}  {early:14.0f}  {late:13.0f}")
+    print("OK" if ok else "Lost on time")
+    return ok
+
+if __name__ == "__main__":
+    sys.exit(0 if simulate_matches() else 1)
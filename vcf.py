@@ -0,0 +1,170 @@
+import time
+from array import array
+from board import *
+
+VCF_HASH_SIZE = 1 << 16  # VCF hash table size
+MAX_VCF_DEPTH = 12       # Maximum number of attacking fours in a sequence
+VCF_NODES = 20000        # Default node budget for one search
+VCF_LEAF_DEPTH = 4       # Fours tried by the optional probe at alpha_beta leaves
+VCF_LEAF_NODES = 200     # Node budget of one leaf probe
+
+# Hash entry results
+VCF_WIN = 1
+VCF_FAIL = 2
+
+class VCF:
+    """Victory by continuous fours.
+
+    The side to move plays a four at every turn, so each defender reply is forced
+    to the single five point. Moves are read from Cell.pattern on the board and
+    played with make_move/del_move, the board is unchanged when a search returns.
+    """
+    def __init__(self, board):
+        self.board = board
+        self.hash_key = array('Q', bytes(8 * VCF_HASH_SIZE))
+        self.hash_depth = array('b', bytes(VCF_HASH_SIZE))
+        self.hash_result = array('b', bytes(VCF_HASH_SIZE))
+        self.hash_move = array('H', bytes(2 * VCF_HASH_SIZE))
+        self.nodes = 0
+        self.max_nodes = VCF_NODES
+        self.deadline = float("inf")
+        self.aborted = False
+        self.stop = None  # Function returning True when the owner stops the search, checked at every node
+        self.line = []  # Winning sequence found by the last search, attacker and defender moves
+
+    def clear(self):
+        for table in (self.hash_key, self.hash_depth, self.hash_result, self.hash_move):
+            clear_table(table)
+
+    def search(self, max_depth=MAX_VCF_DEPTH, max_nodes=VCF_NODES, max_time=float("inf")):
+        """Return the first move of a VCF for the side to move, or None.
+
+        max_time is in milliseconds, a search stopped by it or by max_nodes returns None.
+        """
+        self.nodes = 0
+        self.max_nodes = max_nodes
+        self.deadline = time.time() + max_time / 1000
+        self.aborted = False
+        self.line = []
+        return self.attack(max_depth)
+
+    def probe(self, depth):
+        b = self.board
+        i = b.zobrist_key & (VCF_HASH_SIZE - 1)
+        if self.hash_key[i] != b.zobrist_key:
+            return None
+        result = self.hash_result[i]
+        # A win within fewer fours holds for more, a failure with more fours holds for fewer
+        if result == VCF_WIN and self.hash_depth[i] <= depth:
+            return VCF_WIN
+        if result == VCF_FAIL and self.hash_depth[i] >= depth:
+            return VCF_FAIL
+        return None
+
+    def record(self, depth, result, move=None):
+        b = self.board
+        i = b.zobrist_key & (VCF_HASH_SIZE - 1)
+        self.hash_key[i] = b.zobrist_key
+        self.hash_depth[i] = depth
+        self.hash_result[i] = result
+        self.hash_move[i] = pack_pos(move.x, move.y) if move is not None else 0
+
+    def out_of_time(self):
+        if not self.aborted and (self.nodes >= self.max_nodes or time.time() >= self.deadline or
+                                 self.stop is not None and self.stop()):
+            self.aborted = True
+        return self.aborted
+
+    def attack(self, depth):
+        """Attacker to move, return the winning four or None"""
+        b = self.board
+        self.nodes += 1
+        who, opp = b.who, b.opp
+
+        # Scan the candidates once: our fives, their fives and our fours
+        opp_five = None
+        opp_fives = 0
+        fours = []
+        for v in b.cand_list:
+            c = b.cell[v >> 5][v & 31]
+            p = c.pattern[who]
+            if p[0] == WIN or p[1] == WIN or p[2] == WIN or p[3] == WIN:
+                self.line = [b.pos_table[v]]
+                return b.pos_table[v]
+            q = c.pattern[opp]
+            if q[0] == WIN or q[1] == WIN or q[2] == WIN or q[3] == WIN:
+                opp_fives += 1
+                opp_five = v
+            if b.is_type(c, who, FLEX4):
+                fours.insert(0, v)  # An open four wins outright, try it first
+            elif b.is_type(c, who, BLOCK4):
+                fours.append(v)
+
+        if depth <= 0 or opp_fives >= 2:
+            return None
+        # Their four must be blocked, which only keeps the attack going if it is also our four
+        if opp_fives == 1:
+            if opp_five not in fours:
+                return None
+            fours = [opp_five]
+
+        result = self.probe(depth)
+        if result == VCF_FAIL:
+            return None
+        if result == VCF_WIN:
+            i = b.zobrist_key & (VCF_HASH_SIZE - 1)
+            move = b.pos_table[self.hash_move[i]]
+            if self.hash_move[i] in fours:
+                self.line = [move]
+                return move
+
+        for v in fours:
+            if self.out_of_time():
+                return None
+            move = b.pos_table[v]
+            b.make_move(move)
+            if self.defend(depth):
+                line = self.line
+                b.del_move()
+                self.line = [move] + line
+                self.record(depth, VCF_WIN, move)
+                return move
+            b.del_move()
+
+        if not self.aborted:
+            self.record(depth, VCF_FAIL)
+        return None
+
+    def defend(self, depth):
+        """Defender to move after our four, return True if the attacker still wins"""
+        b = self.board
+        self.nodes += 1
+        who, opp = b.who, b.opp
+
+        block = None
+        blocks = 0
+        for v in b.cand_list:
+            c = b.cell[v >> 5][v & 31]
+            # The defender completes a five first
+            if b.is_type(c, who, WIN):
+                return False
+            if b.is_type(c, opp, WIN):
+                blocks += 1
+                block = v
+
+        if blocks == 0:
+            return False
+        # Two five points cannot both be blocked
+        if blocks >= 2:
+            self.line = []
+            return True
+
+        move = b.pos_table[block]
+        b.make_move(move)
+        win = self.attack(depth - 1)
+        line = self.line
+        b.del_move()
+        if win is None:
+            return False
+        self.line = [move] + line
+        return True
@@ -0,0 +1,193 @@
+import time
+from array import array
+from board import *
+from vcf import VCF
+
+VCT_HASH_SIZE = 1 << 16  # VCT hash table size
+MAX_VCT_DEPTH = 8        # Maximum number of attacking threats in a sequence
+VCT_DEFEND_DEPTH = 4     # Threats looked at when checking the opponent's replies to a root move
+VCT_VCF_DEPTH = 6        # Fours tried by the VCF probes inside a VCT search
+VCT_VCF_NODES = 100      # Node budget of each of those VCF probes
+
+# Hash entry results
+VCT_WIN = 1
+VCT_FAIL = 2
+
+class VCT:
+    """Victory by continuous threats (open threes and fours).
+
+    Only threat-space moves are expanded: the attacker plays moves that make a
+    FLEX3, BLOCK4 or FLEX4, and after a three the defender tries the points that
+    would turn it into a four plus its own fours. Wins by fours alone are left to
+    the VCF solver, which is also used to reject threes the defender can ignore
+    because it has a VCF of its own.
+
+    A win found this way is not a proof. Against a three the defender only gets
+    those replies, and its own VCF is only looked for up to VCT_VCF_DEPTH fours, so
+    another defence can exist.
+    """
+    def __init__(self, board, vcf=None):
+        self.board = board
+        self.vcf = vcf if vcf is not None else VCF(board)
+        self.hash_key = array('Q', bytes(8 * VCT_HASH_SIZE))
+        self.hash_depth = array('b', bytes(VCT_HASH_SIZE))
+        self.hash_result = array('b', bytes(VCT_HASH_SIZE))
+        self.hash_move = array('H', bytes(2 * VCT_HASH_SIZE))
+        self.nodes = 0
+        self.deadline = 0
+        self.max_nodes = None
+        self.aborted = False
+        self.stop = None  # Function returning True when the owner stops the search, checked at every node
+
+    def clear(self):
+        for table in (self.hash_key, self.hash_depth, self.hash_result, self.hash_move):
+            clear_table(table)
+
+    def search(self, max_time, max_depth=MAX_VCT_DEPTH, max_nodes=None):
+        """Return the first move of a VCT for the side to move, or None.
+
+        max_time is in milliseconds, an unfinished search returns None. A search
+        limited by max_nodes alone (max_time infinite) does not depend on speed.
+        """
+        self.nodes = 0
+        self.deadline = time.time() + max_time / 1000
+        self.max_nodes = max_nodes
+        self.aborted = False
+        # Deepen one threat at a time so short wins are found first
+        for depth in range(1, max_depth + 1):
+            move = self.attack(depth)
+            if move is not None or self.aborted:
+                return move
+        return None
+
+    def probe(self, depth):
+        b = self.board
+        i = b.zobrist_key & (VCT_HASH_SIZE - 1)
+        if self.hash_key[i] != b.zobrist_key:
+            return None
+        result = self.hash_result[i]
+        if result == VCT_WIN and self.hash_depth[i] <= depth:
+            return VCT_WIN
+        if result == VCT_FAIL and self.hash_depth[i] >= depth:
+            return VCT_FAIL
+        return None
+
+    def record(self, depth, result, move=None):
+        b = self.board
+        i = b.zobrist_key & (VCT_HASH_SIZE - 1)
+        self.hash_key[i] = b.zobrist_key
+        self.hash_depth[i] = depth
+        self.hash_result[i] = result
+        self.hash_move[i] = pack_pos(move.x, move.y) if move is not None else 0
+
+    def time_left(self):
+        # Milliseconds to the deadline, which bounds the VCF probes as well
+        return (self.deadline - time.time()) * 1000
+
+    def out_of_time(self):
+        # Every node runs VCF probes, so polling the clock each time is cheap in comparison
+        if not self.aborted and (time.time() >= self.deadline or
+                                 self.max_nodes is not None and self.nodes >= self.max_nodes or
+                                 self.stop is not None and self.stop()):
+            self.aborted = True
+        return self.aborted
+
+    def attack(self, depth):
+        """Attacker to move, return the first threat of a forced win or None"""
+        b = self.board
+        self.nodes += 1
+        if self.out_of_time():
+            return None
+
+        # Fours alone are enough
+        move = self.vcf.search(VCT_VCF_DEPTH, VCT_VCF_NODES, self.time_left())
+        if move is not None:
+            return move
+        if depth <= 0:
+            return None
+
+        result = self.probe(depth)
+        if result == VCT_FAIL:
+            return None
+
+        who, opp = b.who, b.opp
+        opp_fives = []
+        threats = []
+        for v in b.cand_list:
+            c = b.cell[v >> 5][v & 31]
+            if b.is_type(c, opp, WIN):
+                opp_fives.append(v)
+            if b.is_type(c, who, FLEX4) or b.is_type(c, who, BLOCK4):
+                threats.insert(0, v)  # Fours first, they leave a single reply
+            elif b.is_type(c, who, FLEX3):
+                threats.append(v)
+
+        # Their four must be blocked, and the block has to be a threat itself
+        if len(opp_fives) >= 2:
+            return None
+        if opp_fives:
+            if opp_fives[0] not in threats:
+                return None
+            threats = opp_fives
+
+        if result == VCT_WIN:
+            i = b.zobrist_key & (VCT_HASH_SIZE - 1)
+            if self.hash_move[i] in threats:
+                return b.pos_table[self.hash_move[i]]
+
+        for v in threats:
+            move = b.pos_table[v]
+            b.make_move(move)
+            win = self.defend(depth)
+            b.del_move()
+            if self.aborted:
+                return None
+            if win:
+                self.record(depth, VCT_WIN, move)
+                return move
+
+        self.record(depth, VCT_FAIL)
+        return None
+
+    def defend(self, depth):
+        """Defender to move after a threat, return True if every relevant reply still loses.
+
+        After a four the only reply is the five point. After a three only the blocks
+        and the defender's own fours are tried, so True is a threat-space result.
+        """
+        b = self.board
+        self.nodes += 1
+        who, opp = b.who, b.opp
+
+        fives = []
+        replies = []
+        for v in b.cand_list:
+            c = b.cell[v >> 5][v & 31]
+            if b.is_type(c, who, WIN):
+                return False
+            if b.is_type(c, opp, WIN):
+                fives.append(v)
+            elif (b.is_type(c, opp, FLEX4) or b.is_type(c, opp, BLOCK4) or
+                  b.is_type(c, who, FLEX4) or b.is_type(c, who, BLOCK4)):
+                # Stop the three becoming a four, or counter with a four of our own
+                replies.append(v)
+
+        if len(fives) >= 2:
+            return True
+        if fives:
+            replies = fives
+        else:
+            # A three does not force anything if the defender can win by fours first. A probe
+            # that ran out of nodes proves nothing either way, so the three is not forcing.
+            if self.vcf.search(VCT_VCF_DEPTH, VCT_VCF_NODES, self.time_left()) is not None or self.vcf.aborted:
+                return False
+        if not replies:
+            return False
+
+        for v in replies:
+            b.make_move(b.pos_table[v])
+            win = self.attack(depth - 1)
+            b.del_move()
+            if win is None:
+                return False
+        return True